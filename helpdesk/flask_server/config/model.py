@@ -6,33 +6,45 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# "gemini" (default) or "stub" for load testing without calling the real API
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini").lower()
+
 # Configure Gemini API
 api_key = os.environ.get("GEMINI_API_KEY")
-if not api_key:
+if not api_key and LLM_BACKEND != "stub":
     raise ValueError("GEMINI_API_KEY environment variable is not set")
 
-# Configure the API key directly (this bypasses Google Cloud project requirements)
-genai.configure(api_key=api_key)
-
-# Use the correct model names for the current Gemini API
-model = None
-model_names = [
-    "gemini-1.5-flash",
-    "gemini-1.5-pro", 
-    "gemini-pro",
-    "models/gemini-1.5-flash",
-    "models/gemini-1.5-pro"
-]
-
-for model_name in model_names:
-    try:
-        model = genai.GenerativeModel(model_name)
-        print(f"Successfully initialized model: {model_name}")
-        break
-    except Exception as e:
-        print(f"Failed to initialize {model_name}: {e}")
-        continue
-
-if model is None:
-    raise ValueError("Could not initialize any Gemini model")
-
+if LLM_BACKEND == "stub":
+    from config.stub_model import StubModel
+
+    model = StubModel(
+        latency_ms=float(os.environ.get("LLM_STUB_LATENCY_MS", 300)),
+        jitter_ms=float(os.environ.get("LLM_STUB_JITTER_MS", 100)),
+        error_rate=float(os.environ.get("LLM_STUB_ERROR_RATE", 0.0))
+    )
+    print(f"Using stub LLM backend ({model.latency_ms}ms latency, {model.error_rate:.0%} errors)")
+else:
+    # Configure the API key directly (this bypasses Google Cloud project requirements)
+    genai.configure(api_key=api_key)
+
+    # Use the correct model names for the current Gemini API
+    model = None
+    model_names = [
+        "gemini-1.5-flash",
+        "gemini-1.5-pro", 
+        "gemini-pro",
+        "models/gemini-1.5-flash",
+        "models/gemini-1.5-pro"
+    ]
+
+    for model_name in model_names:
+        try:
+            model = genai.GenerativeModel(model_name)
+            print(f"Successfully initialized model: {model_name}")
+            break
+        except Exception as e:
+            print(f"Failed to initialize {model_name}: {e}")
+            continue
+
+    if model is None:
+        raise ValueError("Could not initialize any Gemini model")
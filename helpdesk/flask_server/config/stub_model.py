@@ -0,0 +1,47 @@
+import json
+import random
+import re
+import time
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """
+    Stand-in for the Gemini model used for load testing. Replies are canned
+    but shaped like what each prompt asks for, with configurable latency and
+    error injection.
+    """
+
+    def __init__(self, latency_ms=300, jitter_ms=100, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def generate_content(self, prompt, **kwargs):
+        delay_ms = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms))
+        time.sleep(delay_ms / 1000)
+
+        if random.random() < self.error_rate:
+            raise Exception("503 Stub LLM injected error")
+
+        return StubResponse(self._reply(str(prompt)))
+
+    def _reply(self, prompt):
+        if "JSON" in prompt:
+            return json.dumps({
+                "priority": random.randint(1, 10),
+                "summary": "The customer reports a product defect and requests a replacement or refund.",
+                "category": "product defect"
+            })
+
+        if re.search(r"scale of 0-10|number from 0-10|PRIORITY SCORE", prompt):
+            return str(random.randint(1, 10))
+
+        return (
+            "Thank you for reaching out. We are sorry for the trouble with your order "
+            "and have forwarded the details to our support team, who will contact you shortly."
+        )
@@ -0,0 +1,388 @@
+"""
+HTTP load generator for capacity testing the Flask AI server.
+
+Sends an open-loop (Poisson) request mix to the server at one or more
+arrival rates and reports throughput, latency percentiles and error rates
+per endpoint. Latency is measured from each request's scheduled send time,
+so queueing inside the client counts once the server falls behind.
+
+Examples:
+    # Start a local server on the stub LLM and step through arrival rates
+    python load_test.py --start-server --rate 2,5,10,20 --duration 30
+
+    # Run against a server started elsewhere with a custom endpoint mix
+    python load_test.py --base-url http://localhost:8080 --rate 10 \\
+        --mix add_complaint=4,search_similar_complaints=4,priority_score=2
+
+    # Replay recorded requests (JSON lines: {"endpoint", "payload", "offset_s"?})
+    python load_test.py --start-server --replay recorded.jsonl
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MIX = {
+    "add_complaint": 3,
+    "search_similar_complaints": 3,
+    "enhanced_search_complaints": 1,
+    "priority_score": 2,
+    "summarize": 1,
+    "priority-users": 1,
+}
+
+PRODUCTS = ["refrigerator", "washing machine", "laptop", "phone", "television", "microwave", "air conditioner"]
+PROBLEMS = [
+    "was delivered with a huge dent on the side",
+    "stopped working after a week",
+    "makes a loud noise when turned on",
+    "arrived with missing parts",
+    "does not power on at all",
+    "keeps overheating",
+]
+REQUESTS = [
+    "I need a replacement or a refund.",
+    "Please send a technician as soon as possible.",
+    "Customer service has not responded to my emails.",
+    "This is extremely frustrating and disappointing.",
+]
+
+
+def _load_json(name):
+    with open(os.path.join(BASE_DIR, name)) as f:
+        return json.load(f)
+
+
+def _complaint_text():
+    return (
+        f"I ordered a {random.choice(PRODUCTS)} but it {random.choice(PROBLEMS)}. "
+        f"{random.choice(REQUESTS)}"
+    )
+
+
+class PayloadFactory:
+    """Synthetic payloads shaped like the sample request files."""
+
+    def __init__(self):
+        self.test_request = _load_json("test_request.json")
+        self.store = _load_json("store.json")
+        self.search = _load_json("search.json")
+        self.priority_user = _load_json("priority_user.json")
+
+    def make(self, endpoint):
+        if endpoint == "add_complaint":
+            return dict(self.store, text=_complaint_text(), category=random.choice(PRODUCTS))
+        if endpoint in ("search_similar_complaints", "enhanced_search_complaints"):
+            return dict(self.search, query=f"{random.choice(PRODUCTS)} {random.choice(PROBLEMS)}", max_results=5)
+        if endpoint in ("priority_score", "summarize"):
+            return dict(self.test_request, text=f"{self.test_request['text']} {_complaint_text()}")
+        if endpoint == "priority-users":
+            payload = dict(self.priority_user)
+            payload["question"] = f"How to fix a {random.choice(PRODUCTS)} that {random.choice(PROBLEMS)}?"
+            return payload
+        raise ValueError(f"No synthetic payload for endpoint '{endpoint}'")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    n = len(sorted_values)
+    # Rounded first so float noise (99.9 / 100 * 1000 = 999.0000000000001)
+    # does not push an exact rank up by one
+    rank = min(max(1, math.ceil(round(pct / 100 * n, 9))), n)
+    return sorted_values[rank - 1]
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, endpoint, latency_ms, status):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((latency_ms, status))
+
+    def report(self, elapsed_s, offered_rate):
+        endpoints = {}
+        all_latencies = []
+        total = errors = 0
+
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(s[0] for s in samples)
+            statuses = {}
+            endpoint_errors = 0
+            for _, status in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if not (isinstance(status, int) and 200 <= status < 300):
+                    endpoint_errors += 1
+
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": endpoint_errors,
+                "error_rate": round(endpoint_errors / len(samples), 4),
+                "throughput_rps": round(len(samples) / elapsed_s, 2),
+                "statuses": statuses,
+                **_latency_summary(latencies),
+            }
+            all_latencies.extend(latencies)
+            total += len(samples)
+            errors += endpoint_errors
+
+        all_latencies.sort()
+        return {
+            "offered_rps": offered_rate,
+            "achieved_rps": round(total / elapsed_s, 2) if elapsed_s else 0,
+            "duration_s": round(elapsed_s, 2),
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0,
+            **_latency_summary(all_latencies),
+            "endpoints": endpoints,
+        }
+
+
+def _latency_summary(latencies):
+    return {
+        "p50_ms": _round(percentile(latencies, 50)),
+        "p90_ms": _round(percentile(latencies, 90)),
+        "p95_ms": _round(percentile(latencies, 95)),
+        "p99_ms": _round(percentile(latencies, 99)),
+        "max_ms": _round(latencies[-1] if latencies else None),
+    }
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+def send(base_url, endpoint, payload, timeout):
+    """POST a JSON payload and return the HTTP status (or the error name)."""
+    request = urllib.request.Request(
+        f"{base_url}/{endpoint}",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception as e:
+        return type(e).__name__
+
+
+def run_step(args, schedule, offered_rate):
+    """
+    Fire (offset_s, endpoint, payload) requests at their scheduled times
+    using at most args.concurrency in-flight requests.
+    """
+    results = Results()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+
+    def worker(scheduled_at, endpoint, payload):
+        status = send(args.base_url, endpoint, payload, args.timeout)
+        results.record(endpoint, (time.perf_counter() - scheduled_at) * 1000, status)
+
+    start = time.perf_counter()
+    for offset_s, endpoint, payload in schedule:
+        scheduled_at = start + offset_s
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pool.submit(worker, scheduled_at, endpoint, payload)
+
+    pool.shutdown(wait=True)
+    return results.report(time.perf_counter() - start, offered_rate)
+
+
+def synthetic_schedule(rate, duration, mix, factory, replay_pool=None):
+    """Poisson arrivals at `rate` requests/s for `duration` seconds."""
+    endpoints = list(mix.keys())
+    weights = list(mix.values())
+    schedule = []
+    t = random.expovariate(rate)
+    while t < duration:
+        endpoint = random.choices(endpoints, weights)[0]
+        if replay_pool and replay_pool.get(endpoint):
+            payload = random.choice(replay_pool[endpoint])
+        else:
+            payload = factory.make(endpoint)
+        schedule.append((t, endpoint, payload))
+        t += random.expovariate(rate)
+    return schedule
+
+
+def load_replay(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                entries.append((entry.get("offset_s"), entry["endpoint"].lstrip("/"), entry.get("payload", {})))
+    return entries
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip().lstrip("/")] = float(weight or 1)
+    return mix
+
+
+def start_server(args):
+    """
+    Start the server on the stub LLM. Unless --use-real-store is given, its
+    vector store, ingest queue and profiles go to a fresh temporary
+    directory so load test traffic never lands in the real data. Returns
+    (process, data_dir); data_dir is None for the real store.
+    """
+    env = dict(os.environ)
+    data_dir = None
+    if not args.use_real_store:
+        data_dir = tempfile.mkdtemp(prefix="load_test_")
+        env.update({
+            "CHROMA_STORAGE_PATH": os.path.join(data_dir, "chroma_storage"),
+            "INGEST_QUEUE_PATH": os.path.join(data_dir, "ingest_queue.sqlite3"),
+            "PROFILE_DIR": os.path.join(data_dir, "profiles"),
+            "STORE_SNAPSHOT_DIR": os.path.join(data_dir, "snapshots"),
+        })
+        print(f"Using a temporary store in {data_dir}")
+    env.update({
+        "PORT": str(args.port),
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY_MS": str(args.llm_latency_ms),
+        "LLM_STUB_JITTER_MS": str(args.llm_jitter_ms),
+        "LLM_STUB_ERROR_RATE": str(args.llm_error_rate),
+    })
+    command = args.server_cmd.format(port=args.port, python=sys.executable)
+    print(f"Starting server: {command}")
+    process = subprocess.Popen(shlex.split(command), cwd=BASE_DIR, env=env)
+
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            stop_server(process, data_dir)
+            raise RuntimeError(f"Server exited during startup with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{args.base_url}/ingest_stats", timeout=2):
+                print("Server is ready")
+                return process, data_dir
+        except Exception:
+            time.sleep(1)
+
+    stop_server(process, data_dir)
+    raise RuntimeError("Server did not become ready in time")
+
+
+def stop_server(process, data_dir):
+    if process.poll() is None:
+        process.terminate()
+        process.wait(timeout=30)
+    if data_dir is not None:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def print_report(report):
+    print(f"\nOffered {report['offered_rps']} rps -> achieved {report['achieved_rps']} rps, "
+          f"{report['requests']} requests, error rate {report['error_rate']:.2%}, "
+          f"p50 {report['p50_ms']}ms, p99 {report['p99_ms']}ms")
+    print(f"{'endpoint':<28}{'reqs':>7}{'rps':>8}{'err%':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<28}{stats['requests']:>7}{stats['throughput_rps']:>8}"
+              f"{stats['error_rate'] * 100:>8.1f}{stats['p50_ms']:>9}{stats['p90_ms']:>9}"
+              f"{stats['p99_ms']:>9}{stats['max_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop HTTP load generator for the Flask AI server")
+    parser.add_argument("--base-url", default=None, help="Server URL (default http://localhost:<port>)")
+    parser.add_argument("--rate", default="5", help="Arrival rate(s) in requests/s, comma separated for a step ramp")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per rate step")
+    parser.add_argument("--concurrency", type=int, default=64, help="Maximum in-flight requests")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--mix", default=None, help="Endpoint weights, e.g. add_complaint=3,summarize=1")
+    parser.add_argument("--replay", default=None, help="JSON lines file of recorded requests")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+
+    server = parser.add_argument_group("local server")
+    server.add_argument("--start-server", action="store_true", help="Start the server with the stub LLM backend")
+    server.add_argument("--use-real-store", action="store_true",
+                        help="Let the started server use the configured store instead of a temporary one")
+    server.add_argument("--port", type=int, default=8080)
+    server.add_argument("--server-cmd", default="{python} main.py",
+                        help="Server command, e.g. 'gunicorn -w 1 --threads 16 -b 0.0.0.0:{port} main:app'")
+    server.add_argument("--startup-timeout", type=float, default=180)
+    server.add_argument("--llm-latency-ms", type=float, default=300)
+    server.add_argument("--llm-jitter-ms", type=float, default=100)
+    server.add_argument("--llm-error-rate", type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.base_url is None:
+        args.base_url = f"http://localhost:{args.port}"
+    args.base_url = args.base_url.rstrip("/")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    mix = parse_mix(args.mix) if args.mix else dict(DEFAULT_MIX)
+    factory = PayloadFactory()
+    rates = [float(r) for r in args.rate.split(",")]
+
+    replay = load_replay(args.replay) if args.replay else []
+    timed_replay = bool(replay) and all(entry[0] is not None for entry in replay)
+    replay_pool = {}
+    for _, endpoint, payload in replay:
+        replay_pool.setdefault(endpoint, []).append(payload)
+    if replay and not args.mix:
+        mix = {endpoint: len(payloads) for endpoint, payloads in replay_pool.items()}
+
+    process, data_dir = start_server(args) if args.start_server else (None, None)
+    reports = []
+    try:
+        if timed_replay:
+            # Recorded timing: replay requests at their original offsets
+            schedule = sorted(replay, key=lambda entry: entry[0])
+            span = max(schedule[-1][0], 1e-9)
+            reports.append(run_step(args, schedule, round(len(schedule) / span, 2)))
+            print_report(reports[-1])
+        else:
+            for rate in rates:
+                schedule = synthetic_schedule(rate, args.duration, mix, factory, replay_pool)
+                print(f"\nRunning {rate} rps for {args.duration}s ({len(schedule)} requests)...")
+                reports.append(run_step(args, schedule, round(len(schedule) / args.duration, 2)))
+                print_report(reports[-1])
+    finally:
+        if process is not None:
+            stop_server(process, data_dir)
+
+    if len(reports) > 1:
+        # Saturation: first step where the server cannot keep up with the offered load
+        saturated = next((r for r in reports if r["achieved_rps"] < 0.95 * r["offered_rps"] or r["error_rate"] > 0.01), None)
+        print(f"\nSaturation point: {saturated['offered_rps'] if saturated else 'not reached'} rps")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from utils.summary import summarize_text
 from utils.priority_prediction import get_priority_score
 from utils.priority_user import get_priority_users, format_priority_report
-from utils.store import add_complaint, search_complaints, search_similar_complaints, get_all_complaints, enhanced_search_complaints
+from utils.prompt_budget import precompute_user_summaries
+from utils.store import add_complaint, enqueue_complaint, get_ingest_stats, QueueFullError, search_complaints, search_similar_complaints, get_all_complaints, enhanced_search_complaints, get_shard_stats, rebalance_shards, validate_metadata
 from utils.chat_bot import resolve_complaint_query
+from utils.semantic_cache import cached_resolve, report_false_hit, get_cache_stats
+from utils.profiling import profiled, is_admin_request, list_profiles, load_profile
+from utils.triage import triage_complaint, TriageError, TriageFailedError
+from utils.maintenance import storage_report, compact_store, create_snapshot
 import os
 from dotenv import load_dotenv
 import uuid
@@ -16,6 +21,7 @@ app = Flask(__name__)
 CORS(app)
 
 @app.route('/summarize', methods=['POST'])
+@profiled
 def summarize_plain():
     data = request.get_json()
     if not data or 'text' not in data:
@@ -33,6 +39,7 @@ def summarize_plain():
         return jsonify({'error': f'Failed to summarize text: {str(e)}'}), 500
 
 @app.route('/priority_score', methods=['POST'])
+@profiled
 def priority_score():
     data = request.get_json()
     if not data or 'text' not in data:
@@ -50,6 +57,7 @@ def priority_score():
         return jsonify({'error': f'Failed to get priority score: {str(e)}'}), 500
 
 @app.route('/priority-users', methods=['POST'])
+@profiled
 def get_priority_users_endpoint():
     print("Received request to get priority users")
     try:
@@ -82,6 +90,19 @@ def get_priority_users_endpoint():
     except Exception as e:
         return jsonify({'error': f'Failed to analyze priority users: {str(e)}'}), 500
 
+@app.route('/priority-users/precompute', methods=['POST'])
+def precompute_priority_users():
+    """Warm the per-user history summaries and query embeddings ahead of /priority-users."""
+    data = request.get_json()
+    if not data or not isinstance(data.get('users'), list):
+        return jsonify({'error': 'Users must be a list'}), 400
+
+    try:
+        precompute_user_summaries(data['users'])
+        return jsonify({'message': 'User summaries precomputed', 'users': len(data['users'])}), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to precompute user summaries: {str(e)}'}), 500
+
 @app.route('/add_complaint', methods=['POST'])
 def add():
     data = request.get_json()
@@ -108,15 +129,79 @@ def add():
         metadata = {'type': 'complaint'}
     
     try:
-        add_complaint(complaint, complaint_id, metadata)
+        # Embedding and the vector store write happen in the background worker
+        enqueue_complaint(complaint, complaint_id, metadata)
         return jsonify({
             'message': 'Complaint added successfully', 
             'id': complaint_id,
-            'metadata': metadata
+            'metadata': metadata,
+            'queued': True
         }), 200
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ingest_stats', methods=['GET'])
+def ingest_stats():
+    """Queue depth, flush latency and backpressure counters for /add_complaint."""
+    try:
+        return jsonify(get_ingest_stats()), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/triage', methods=['POST'])
+@profiled
+def triage():
+    """
+    Priority, summary, suggested category and similar complaints for a new
+    complaint in one call, which also queues it for the vector store.
+    """
+    data = request.get_json()
+    if not data or 'text' not in data:
+        return jsonify({'error': 'Missing text in request'}), 400
+
+    text = data['text'].strip()
+    if not text:
+        return jsonify({'error': 'Empty text provided'}), 400
+
+    categories = data.get('categories')
+    if categories is not None and (not isinstance(categories, list) or not all(isinstance(c, str) for c in categories)):
+        return jsonify({'error': 'Categories must be a list of strings'}), 400
+
+    metadata = {
+        'timestamp': data.get('timestamp'),
+        'category': data.get('category'),
+        'priority': data.get('priority'),
+        'user_id': data.get('user_id')
+    }
+    metadata = {k: v for k, v in metadata.items() if v is not None}
+    try:
+        validate_metadata(metadata)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        result = triage_complaint(
+            text,
+            metadata=metadata,
+            categories=categories,
+            k=data.get('max_results', 5)
+        )
+        return jsonify(result), 200
+    except TriageFailedError as e:
+        # The complaint is stored anyway when queued is true
+        body = {'id': e.complaint_id, 'queued': e.queued}
+        if isinstance(e.cause, TriageError):
+            return jsonify({'error': f'Invalid triage output from model: {str(e)}', **body}), 502
+        return jsonify({'error': f'Failed to triage complaint: {str(e)}', **body}), 500
+    except Exception as e:
+        return jsonify({'error': f'Failed to triage complaint: {str(e)}'}), 500
+
 # @app.route('/search_complaints', methods=['POST'])
 # def search():
 #     data = request.get_json()
@@ -136,11 +221,13 @@ def add():
 #         return jsonify({'error': str(e)}), 500
 
 @app.route('/search_similar_complaints', methods=['POST'])
+@profiled
 def search_similar():
     data = request.get_json()
     query = data.get('query', '').strip()
     max_results = data.get('max_results', 5)
     similarity_threshold = data.get('similarity_threshold', 1.2)  # More lenient default
+    shard = data.get('shard')  # Optional shard key value, e.g. a category
     
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
@@ -149,13 +236,15 @@ def search_similar():
         results = search_similar_complaints(
             query=query, 
             k=max_results, 
-            threshold=similarity_threshold
+            threshold=similarity_threshold,
+            shard=shard
         )
         return jsonify(results), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/enhanced_search_complaints', methods=['POST'])
+@profiled
 def enhanced_search():
     data = request.get_json()
     query = data.get('query', '').strip()
@@ -178,7 +267,64 @@ def get_all():
         return jsonify(results), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@app.route('/shards', methods=['GET'])
+def shards():
+    """Shard configuration and per-shard complaint counts."""
+    try:
+        return jsonify(get_shard_stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/shards/rebalance', methods=['POST'])
+def shards_rebalance():
+    """Move complaints into the shards required by the current STORE_SHARD_BY setting (admin only)."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(rebalance_shards(dry_run=bool(data.get('dry_run', False)))), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/maintenance/stats', methods=['GET'])
+def maintenance_stats():
+    """Store disk size, index fragmentation and (with ?measure_load=1) cold load time (admin only)."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    try:
+        measure_load = request.args.get('measure_load', '').lower() in ('1', 'true', 'yes')
+        return jsonify(storage_report(measure_load=measure_load)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/maintenance/compact', methods=['POST'])
+def maintenance_compact():
+    """Rebuild vector indexes, drop orphaned segments and vacuum the store (admin only)."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(compact_store(measure_load=bool(data.get('measure_load', False)))), 200
+    except Exception as e:
+        return jsonify({'error': f'Compaction failed: {str(e)}'}), 500
+
+@app.route('/maintenance/snapshot', methods=['POST'])
+def maintenance_snapshot():
+    """Write a point-in-time snapshot that new workers can start from (admin only)."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    try:
+        return jsonify(create_snapshot()), 200
+    except Exception as e:
+        return jsonify({'error': f'Snapshot failed: {str(e)}'}), 500
+
 @app.route('/resolve_complaint', methods=['POST'])
+@profiled
 def resolve_complaint():
     data = request.get_json()
     user_query = data.get('query', '').strip()
@@ -187,10 +333,60 @@ def resolve_complaint():
         return jsonify({'error': 'User query is required'}), 400
     
     try:
-        response = resolve_complaint_query(user_query)
-        return jsonify({'response': response}), 200
+        # Paraphrases of already answered complaints reuse the stored response
+        response, cache_info = cached_resolve(user_query, resolve_complaint_query)
+        return jsonify({'response': response, **cache_info}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/resolve_cache/stats', methods=['GET'])
+def resolve_cache_stats():
+    """Hit rate, eviction and false-hit counters for the /resolve_complaint cache."""
+    try:
+        return jsonify(get_cache_stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/resolve_cache/report_false_hit', methods=['POST'])
+def resolve_cache_report_false_hit():
+    """Drop a cached response that did not fit the query it was served for."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    data = request.get_json(silent=True) or {}
+    cache_id = data.get('cache_id') if isinstance(data, dict) else None
+
+    if not isinstance(cache_id, str) or not cache_id.strip():
+        return jsonify({'error': 'cache_id must be a non-empty string'}), 400
+    cache_id = cache_id.strip()
+
+    try:
+        if not report_false_hit(cache_id):
+            return jsonify({'error': 'Cache entry not found'}), 404
+        return jsonify({'message': 'Cache entry removed', 'cache_id': cache_id}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+@app.route('/profiles', methods=['GET'])
+def profiles():
+    """List recent request profiles (requires the X-Profile-Token admin header)."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'profiles': list_profiles()}), 200
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def profile_detail(profile_id):
+    """Fetch a profile summary, or its collapsed stacks with ?format=folded."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    fmt = request.args.get('format', 'json')
+    profile = load_profile(profile_id, fmt)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    if fmt == 'folded':
+        return Response(profile, mimetype='text/plain')
+    return jsonify(profile), 200
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,81 @@
+"""
+Complaint store management commands.
+
+Usage:
+    python manage_store.py shards
+    python manage_store.py rebalance [--dry-run]
+    python manage_store.py stats [--measure-load]
+    python manage_store.py compact [--measure-load]
+    python manage_store.py snapshot
+    python manage_store.py restore <snapshot-name|path|latest>
+
+Sharding is configured with STORE_SHARD_BY ("", "hash" or a metadata key
+such as "category") and STORE_SHARD_COUNT (number of hash shards).
+compact, snapshot and restore must not run while the server is up:
+compaction replaces every collection with a rebuilt copy, and Chroma's
+local store cannot be shared between processes. Stop the server first, or
+use the /maintenance endpoints of the running server instead.
+"""
+import argparse
+import json
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Complaint store management")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("shards", help="Show shard configuration and complaint counts")
+
+    rebalance_parser = subparsers.add_parser("rebalance", help="Move complaints into their configured shards")
+    rebalance_parser.add_argument("--dry-run", action="store_true", help="Report moves without changing anything")
+    rebalance_parser.add_argument("--batch-size", type=int, default=500)
+
+    stats_parser = subparsers.add_parser("stats", help="Disk size, index fragmentation and load time")
+    stats_parser.add_argument("--measure-load", action="store_true", help="Time a cold open and first query")
+
+    compact_parser = subparsers.add_parser("compact", help="Rebuild indexes, drop orphaned segments and vacuum")
+    compact_parser.add_argument("--measure-load", action="store_true", help="Time a cold open before and after")
+
+    subparsers.add_parser("snapshot", help="Write a point-in-time snapshot of the store")
+
+    restore_parser = subparsers.add_parser("restore", help="Replace the store with a snapshot")
+    restore_parser.add_argument("snapshot", help="Snapshot name, path, or 'latest'")
+
+    args = parser.parse_args()
+
+    # Only import the store for commands that need it open; restore must
+    # copy files before any Chroma client is created
+    if args.command == "restore":
+        from utils.maintenance import claim_store, restore_snapshot
+        lock = claim_store()
+        result = restore_snapshot(args.snapshot)
+        lock.close()
+    elif args.command == "stats":
+        from utils.maintenance import storage_report
+        result = storage_report(measure_load=args.measure_load)
+    else:
+        from utils.store import get_shard_stats, rebalance_shards, ingest_queue
+        from utils.maintenance import compact_store, create_snapshot
+
+        if args.command == "shards":
+            result = get_shard_stats()
+        elif args.command == "rebalance":
+            # Flush queued complaints first so they are placed by the same rules
+            ingest_queue.drain()
+            result = rebalance_shards(batch_size=args.batch_size, dry_run=args.dry_run)
+        elif args.command == "compact":
+            ingest_queue.drain()
+            result = compact_store(measure_load=args.measure_load)
+        elif args.command == "snapshot":
+            ingest_queue.drain()
+            result = create_snapshot()
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import types
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def hashed_embedding(texts, dimensions=64):
+    """
+    Deterministic bag-of-words vectors: texts sharing words point the same
+    way, so tests do not have to load the sentence-transformers model.
+    """
+    vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in str(text).lower().split():
+            vectors[row, zlib.crc32(word.encode("utf-8")) % dimensions] += 1.0
+    return vectors
+
+
+@pytest.fixture
+def fake_module(monkeypatch):
+    """
+    Put a module with the given attributes in sys.modules for the test,
+    e.g. to replace utils.store, which opens the Chroma store on import.
+    """
+    def install(name, **attributes):
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        monkeypatch.setitem(sys.modules, name, module)
+        return module
+
+    return install
+
+
+@pytest.fixture
+def fresh_import(monkeypatch):
+    """Import a module again so it picks up the fakes and env of this test."""
+    import importlib
+
+    def load(name):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+        module = importlib.import_module(name)
+        monkeypatch.setitem(sys.modules, name, module)
+        return module
+
+    return load
@@ -0,0 +1,120 @@
+import sqlite3
+
+import pytest
+
+from conftest import hashed_embedding
+from utils.ingest_queue import IngestQueue, QueueFullError
+
+
+class FakeStore:
+    """Collects flushed complaints; ids listed in `failing` make a write fail."""
+
+    def __init__(self, failing=(), fail_all=False):
+        self.failing = set(failing)
+        self.fail_all = fail_all
+        self.calls = 0
+        self.written = []
+
+    def flush(self, documents, ids, metadatas, embeddings):
+        self.calls += 1
+        if self.fail_all or self.failing.intersection(ids):
+            raise RuntimeError("store unavailable")
+        self.written.extend(ids)
+
+
+def make_queue(tmp_path, store, **options):
+    # Nothing here wakes the background worker, so each test flushes explicitly
+    options.setdefault("batch_size", 10)
+    options.setdefault("flush_interval", 3600)
+    return IngestQueue(str(tmp_path / "queue.sqlite3"), store.flush, hashed_embedding, **options)
+
+
+def dead_letter_ids(tmp_path):
+    with sqlite3.connect(str(tmp_path / "queue.sqlite3")) as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM dead_letter ORDER BY id")]
+
+
+def test_enqueue_rejects_when_full(tmp_path):
+    queue = make_queue(tmp_path, FakeStore(), max_depth=2)
+    queue.enqueue("printer jams", "c1", {})
+    queue.enqueue("screen flickers", "c2", {})
+
+    with pytest.raises(QueueFullError):
+        queue.enqueue("battery drains", "c3", {})
+
+    assert queue.depth() == 2
+    assert queue.get_stats()['rejected_total'] == 1
+
+    # Flushing frees room again
+    assert queue.flush_once() == 2
+    queue.enqueue("battery drains", "c3", {})
+    assert queue.depth() == 1
+
+
+def test_pending_complaints_are_searchable(tmp_path):
+    queue = make_queue(tmp_path, FakeStore())
+    queue.enqueue("printer paper jam", "c1", {"category": "hardware"})
+    queue.enqueue("vpn login fails", "c2", {"category": "network"})
+
+    query = hashed_embedding(["printer paper jam"])[0]
+    assert [match[0] for match in queue.search_pending(query, k=2)] == ["c1", "c2"]
+
+    only_network = queue.search_pending(query, k=2, metadata_filter=lambda m: m.get("category") == "network")
+    assert [match[0] for match in only_network] == ["c2"]
+
+
+def test_flush_writes_batch_with_given_embeddings(tmp_path):
+    store = FakeStore()
+    queue = make_queue(tmp_path, store)
+    queue.enqueue("printer paper jam", "c1", {"priority": 3}, embedding=[0.5] * 64)
+
+    assert queue.flush_once() == 1
+    assert store.written == ["c1"]
+    assert queue.depth() == 0
+    assert queue.get_stats()['flushed_total'] == 1
+
+
+def test_failed_batch_is_retried_then_bad_rows_dead_lettered(tmp_path):
+    store = FakeStore(failing={"bad"})
+    queue = make_queue(tmp_path, store, max_attempts=2)
+    queue.enqueue("printer paper jam", "good", {})
+    queue.enqueue("malformed complaint", "bad", {})
+
+    # Below max_attempts the whole batch stays queued for a retry
+    with pytest.raises(RuntimeError):
+        queue.flush_once()
+    assert queue.depth() == 2
+    assert dead_letter_ids(tmp_path) == []
+
+    # Then it is written row by row and only the failing row is set aside
+    assert queue.flush_once() == 2
+    assert store.written == ["good"]
+    assert queue.depth() == 0
+    assert dead_letter_ids(tmp_path) == ["bad"]
+
+    stats = queue.get_stats()
+    assert stats['failed_batches'] == 2
+    assert stats['dead_lettered_total'] == 1
+    assert stats['dead_letter_depth'] == 1
+
+
+def test_batch_keeps_rows_when_every_row_fails(tmp_path):
+    store = FakeStore(fail_all=True)
+    queue = make_queue(tmp_path, store, max_attempts=1)
+    queue.enqueue("printer paper jam", "c1", {})
+    queue.enqueue("vpn login fails", "c2", {})
+
+    # An outage must not empty the queue into the dead-letter table
+    for _ in range(3):
+        with pytest.raises(Exception, match="All 2 complaints in the batch failed"):
+            queue.flush_once()
+
+    assert queue.depth() == 2
+    assert dead_letter_ids(tmp_path) == []
+    assert queue.get_stats()['leased'] == 0
+
+    # Once the store is back the same rows go through
+    store.fail_all = False
+    assert queue.flush_once() == 2
+    assert sorted(store.written) == ["c1", "c2"]
+    assert queue.depth() == 0
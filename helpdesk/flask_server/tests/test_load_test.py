@@ -0,0 +1,24 @@
+import pytest
+
+from load_test import percentile
+
+
+def test_percentile_of_empty_list_is_none():
+    assert percentile([], 50) is None
+
+
+@pytest.mark.parametrize("pct, expected", [(0, 1), (10, 1), (50, 5), (90, 9), (95, 10), (99, 10), (100, 10)])
+def test_percentile_uses_nearest_rank(pct, expected):
+    assert percentile(list(range(1, 11)), pct) == expected
+
+
+def test_percentile_of_large_sample():
+    values = list(range(1, 1001))
+    assert percentile(values, 50) == 500
+    assert percentile(values, 99) == 990
+    assert percentile(values, 99.9) == 999
+
+
+def test_percentile_of_single_value():
+    assert percentile([0.25], 1) == 0.25
+    assert percentile([0.25], 99) == 0.25
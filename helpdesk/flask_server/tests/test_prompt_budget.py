@@ -0,0 +1,67 @@
+import pytest
+
+from conftest import hashed_embedding
+
+
+@pytest.fixture
+def prompt_budget(fake_module, fresh_import):
+    fake_module("utils.embedding", embedding_function=hashed_embedding)
+    return fresh_import("utils.prompt_budget")
+
+
+def line_tokens(prompt_budget, queries):
+    return sum(prompt_budget.estimate_tokens(f"- {q}\n") for q in queries)
+
+
+def test_nothing_selected_without_queries_or_budget(prompt_budget):
+    assert prompt_budget.select_solved_queries([], "printer jam") == []
+    assert prompt_budget.select_solved_queries(["", "  ", None, 42], "printer jam") == []
+    assert prompt_budget.select_solved_queries(["printer jam fixed"], "printer jam", token_budget=0) == []
+
+
+def test_most_relevant_query_comes_first(prompt_budget):
+    queries = ["vpn login fails after update", "printer paper jam in tray two", "email quota exceeded"]
+    selected = prompt_budget.select_solved_queries(queries, "printer paper jam", token_budget=100)
+
+    assert selected[0] == "printer paper jam in tray two"
+    assert sorted(selected) == sorted(queries)
+
+
+def test_selection_stays_within_token_budget(prompt_budget):
+    queries = [f"ticket {i} about printer driver version {i} on floor {i}" for i in range(50)]
+    selected = prompt_budget.select_solved_queries(queries, "printer driver", token_budget=60)
+
+    assert selected
+    assert line_tokens(prompt_budget, selected) <= 60
+
+
+def test_oversized_query_is_skipped_not_truncated(prompt_budget):
+    long_query = "printer " * 200
+    selected = prompt_budget.select_solved_queries([long_query, "printer jam"], "printer", token_budget=20)
+    assert selected == ["printer jam"]
+
+
+def test_duplicates_are_dropped(prompt_budget):
+    queries = [
+        "printer paper jam",
+        "  printer paper jam  ",
+        "paper jam printer",  # same words, so the same vector
+        "vpn login fails",
+    ]
+    selected = prompt_budget.select_solved_queries(queries, "printer paper jam", token_budget=100)
+    assert selected == ["printer paper jam", "vpn login fails"]
+
+
+def test_dedupe_threshold_above_one_keeps_near_duplicates(prompt_budget):
+    queries = ["printer paper jam", "paper jam printer"]
+    selected = prompt_budget.select_solved_queries(queries, "printer", token_budget=100, dedupe_threshold=1.01)
+    assert sorted(selected) == sorted(queries)
+
+
+def test_history_summary_is_bounded(prompt_budget):
+    queries = ["x" * 5000 + " printer jam"] + [f"{'topic%d' % i * 5} issue" for i in range(100)]
+    summary = prompt_budget.summarize_history("u1", queries, expertise_domain="Hardware " * 50)
+
+    assert summary.startswith("Total solved queries: 101.")
+    assert prompt_budget.estimate_tokens(summary) <= prompt_budget.PROMPT_SUMMARY_TOKENS
+    assert "xxxxxxxx" not in summary
@@ -0,0 +1,59 @@
+import re
+import zlib
+
+import pytest
+
+from utils import sharding
+
+# Chroma collection names: 3-63 characters of letters, digits, '_' and '-'
+VALID_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{1,61}[a-z0-9]$")
+
+
+@pytest.fixture
+def shard_by(monkeypatch):
+    def configure(key, count=4):
+        monkeypatch.setattr(sharding, "SHARD_BY", key)
+        monkeypatch.setattr(sharding, "SHARD_COUNT", count)
+    return configure
+
+
+def test_unsharded_store_uses_base_collection(shard_by):
+    shard_by("")
+    assert sharding.shard_for("c1", {"category": "Hardware"}) == sharding.BASE_COLLECTION
+
+
+def test_hash_sharding_is_stable_and_in_range(shard_by):
+    shard_by("hash", count=4)
+    names = {sharding.shard_for(f"complaint-{i}", None) for i in range(200)}
+
+    assert names == {f"complaints_h{n}" for n in range(4)}
+    assert sharding.shard_for("c1", {}) == f"complaints_h{zlib.crc32(b'c1') % 4}"
+    assert sharding.shard_for("c1", {"category": "Hardware"}) == sharding.shard_for("c1", {})
+
+
+def test_metadata_sharding_uses_sanitized_value(shard_by):
+    shard_by("category")
+    assert sharding.shard_for("c1", {"category": "Billing & Payments"}) == "complaints_billing_payments"
+    assert sharding.shard_for("c2", {"category": "billing payments"}) == "complaints_billing_payments"
+
+
+@pytest.mark.parametrize("metadata", [None, {}, {"category": ""}, {"priority": 3}])
+def test_metadata_sharding_without_key_uses_base_collection(shard_by, metadata):
+    shard_by("category")
+    assert sharding.shard_for("c1", metadata) == sharding.BASE_COLLECTION
+
+
+@pytest.mark.parametrize("value", ["x" * 500, "!!!", "Électroménager", 42, "Ünïcödé " * 20])
+def test_metadata_shard_names_are_valid_collection_names(shard_by, value):
+    shard_by("category")
+    name = sharding.shard_for("c1", {"category": value})
+
+    assert VALID_NAME.match(name), name
+    assert sharding.is_complaint_shard(name)
+
+
+def test_long_values_stay_distinct(shard_by):
+    shard_by("category")
+    first = sharding.shard_for("c1", {"category": "a" * 100 + "1"})
+    second = sharding.shard_for("c1", {"category": "a" * 100 + "2"})
+    assert first != second
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from conftest import hashed_embedding
+
+
+@pytest.fixture
+def triage(monkeypatch, fake_module, fresh_import):
+    # Stub LLM backend, and no Chroma store or embedding model on import
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    fake_module("utils.embedding", embedding_function=hashed_embedding)
+    fake_module(
+        "utils.store",
+        enqueue_complaint=None,
+        search_similar_complaints=None,
+        QueueFullError=type("QueueFullError", (Exception,), {}),
+    )
+    fresh_import("config.model")
+    fresh_import("utils.summary")
+    return fresh_import("utils.triage")
+
+
+def test_parses_plain_json(triage):
+    result = triage.parse_triage_output(
+        '{"priority": 7, "summary": "Customer reports a **broken** screen.", "category": "product defect"}'
+    )
+    assert result == {'priority': 7, 'summary': "Customer reports a broken screen.", 'category': "product defect"}
+
+
+def test_tolerates_code_fences_and_surrounding_text(triage):
+    raw = 'Here you go:\n```json\n{"priority": "4", "summary": "Late delivery."}\n```'
+    result = triage.parse_triage_output(raw)
+    assert result['priority'] == 4
+    assert result['category'] is None
+
+
+@pytest.mark.parametrize("priority, expected", [(7.6, 8), (15, 10), (0, 1), (-3, 1), ("2.4", 2)])
+def test_priority_is_rounded_and_clamped(triage, priority, expected):
+    raw = f'{{"priority": {priority!r}, "summary": "s"}}'.replace("'", '"')
+    assert triage.parse_triage_output(raw)['priority'] == expected
+
+
+def test_category_snaps_to_allowed_list(triage):
+    categories = ["Hardware", "Billing"]
+    raw = '{"priority": 5, "summary": "s", "category": " hardware "}'
+    assert triage.parse_triage_output(raw, categories)['category'] == "Hardware"
+
+    raw = '{"priority": 5, "summary": "s", "category": "Shipping"}'
+    assert triage.parse_triage_output(raw, categories)['category'] is None
+
+
+@pytest.mark.parametrize("raw", [
+    None,
+    "",
+    "high priority, printer broken",
+    '{"priority": 5, "summary": "s"',
+    '{"priority": 5}',
+    '{"priority": 5, "summary": "   "}',
+    '{"priority": 5, "summary": 42}',
+    '{"summary": "s"}',
+    '{"priority": null, "summary": "s"}',
+    '{"priority": "high", "summary": "s"}',
+    '{"priority": true, "summary": "s"}',
+    '{"priority": 1e400, "summary": "s"}',
+    '{"priority": -1e400, "summary": "s"}',
+    '{"priority": NaN, "summary": "s"}',
+    '{"priority": [5], "summary": "s"}',
+])
+def test_invalid_output_raises_triage_error(triage, raw):
+    with pytest.raises(triage.TriageError):
+        triage.parse_triage_output(raw)
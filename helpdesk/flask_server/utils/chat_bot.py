@@ -31,15 +31,6 @@ User complaint:
 
 def resolve_complaint_query(user_query):
     try:
-        # List available models for debugging
-        print("Listing available models...")
-        try:
-            models = genai.list_models()
-            available_models = [m.name for m in models]
-            print(f"Available models: {available_models[:5]}...")  # Show first 5
-        except Exception as model_list_error:
-            print(f"Could not list models: {model_list_error}")
-        
         # Test if the model is accessible with a simple prompt first
         print("Testing model access...")
         #test_result = model.generate_content("Say hello")
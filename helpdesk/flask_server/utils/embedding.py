@@ -0,0 +1,4 @@
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+# Shared MiniLM embedding model so every module loads it only once
+embedding_function = SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
@@ -0,0 +1,434 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: pausing flushes then only covers the current process
+    fcntl = None
+
+# SQLite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+
+class QueueFullError(Exception):
+    """Raised when the ingest queue is at its backpressure limit."""
+    pass
+
+
+class IngestQueue:
+    """
+    Durable write-behind queue for complaints.
+
+    Complaints are written to a local SQLite file and searched from there
+    until they are flushed. The background worker claims each batch with a
+    time-limited lease before writing it to the vector store, so a batch
+    whose flush crashed is picked up again and a flush never races another
+    flush of the same rows.
+    """
+
+    def __init__(self, path, flush, embed, batch_size=32, flush_interval=0.5, max_depth=1000,
+                 max_attempts=3, lease_s=60):
+        self.path = path
+        self.flush = flush
+        self.embed = embed
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.lease_s = lease_s
+
+        # Identifies this process's leases in the queue file
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        # Parsed vectors of pending complaints, so searches do not decode JSON every time
+        self._vectors = {}
+
+        self._stats = {
+            'enqueued_total': 0,
+            'flushed_total': 0,
+            'rejected_total': 0,
+            'failed_batches': 0,
+            'dead_lettered_total': 0,
+            'batches': 0,
+            'last_flush_ms': None,
+            'max_flush_ms': None,
+            'total_flush_ms': 0.0,
+            'last_error': None,
+        }
+
+        # Autocommit mode; writes use explicit BEGIN IMMEDIATE transactions
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "id TEXT UNIQUE NOT NULL, "
+            "document TEXT NOT NULL, "
+            "metadata TEXT NOT NULL, "
+            "embedding TEXT, "
+            "enqueued_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "lease_owner TEXT, "
+            "lease_until REAL)"
+        )
+        # Queue files written by older versions lack the newer columns
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(queue)")]
+        for column, definition in (
+            ('attempts', "INTEGER NOT NULL DEFAULT 0"),
+            ('lease_owner', "TEXT"),
+            ('lease_until', "REAL"),
+        ):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE queue ADD COLUMN {column} {definition}")
+        # Complaints that could not be written to the vector store on their own
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "id TEXT PRIMARY KEY, "
+            "document TEXT NOT NULL, "
+            "metadata TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, "
+            "failed_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL, "
+            "error TEXT)"
+        )
+
+        # Anything left over from a previous run is flushed by the worker
+        recovered = self.depth()
+        if recovered:
+            print(f"Ingest queue has {recovered} pending complaints from a previous run")
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction on the shared connection. Callers hold self._lock."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        """Lock shared by the processes using this queue file."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def start(self):
+        """Start the background flush worker if it is not already running."""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name="ingest-queue-worker", daemon=True)
+            self._worker.start()
+
+    def enqueue(self, document, complaint_id, metadata, embedding=None):
+        """
+        Durably enqueue a complaint. Raises QueueFullError when the queue is
+        at max_depth so callers can apply backpressure.
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                depth = conn.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+                if depth >= self.max_depth:
+                    self._stats['rejected_total'] += 1
+                    raise QueueFullError(
+                        f"Ingest queue is full ({self.max_depth} pending complaints)"
+                    )
+
+                conn.execute(
+                    "INSERT INTO queue (id, document, metadata, embedding, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        complaint_id,
+                        document,
+                        json.dumps(metadata),
+                        json.dumps([float(x) for x in embedding]) if embedding is not None else None,
+                        time.time(),
+                    )
+                )
+
+            if embedding is not None:
+                self._vectors[complaint_id] = np.asarray(embedding, dtype=np.float32)
+            self._stats['enqueued_total'] += 1
+
+        if depth + 1 >= self.batch_size:
+            self._wakeup.set()
+        self.start()
+
+    def _vectors_for(self, items):
+        """
+        Vectors for the given (id, document) pending complaints: cached,
+        stored in the queue file by whichever worker embedded them, or
+        embedded now and stored for the other workers.
+        """
+        ids = [complaint_id for complaint_id, _ in items]
+        with self._lock:
+            missing = [i for i in ids if i not in self._vectors]
+            for offset in range(0, len(missing), _MAX_PARAMS):
+                chunk = missing[offset:offset + _MAX_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT id, embedding FROM queue WHERE embedding IS NOT NULL "
+                    f"AND id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for complaint_id, embedding in rows:
+                    self._vectors[complaint_id] = np.asarray(json.loads(embedding), dtype=np.float32)
+            to_embed = [(i, document) for i, document in items if i not in self._vectors]
+
+        if to_embed:
+            vectors = [np.asarray(v, dtype=np.float32) for v in self.embed([d for _, d in to_embed])]
+            with self._lock:
+                with self._transaction() as conn:
+                    conn.executemany(
+                        "UPDATE queue SET embedding = ? WHERE id = ? AND embedding IS NULL",
+                        [(json.dumps(v.tolist()), i) for (i, _), v in zip(to_embed, vectors)]
+                    )
+                for (complaint_id, _), vector in zip(to_embed, vectors):
+                    self._vectors[complaint_id] = vector
+
+        with self._lock:
+            return {i: self._vectors[i] for i in ids if i in self._vectors}
+
+    def search_pending(self, query_embedding, k=5, metadata_filter=None):
+        """
+        Search complaints that have not been flushed yet. Returns
+        (id, document, distance) tuples using the same squared L2 distance
+        as the Chroma collection, closest first.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT id, document, metadata FROM queue ORDER BY seq").fetchall()
+            # Forget vectors of complaints another worker has flushed
+            present = {row[0] for row in rows}
+            for complaint_id in [i for i in self._vectors if i not in present]:
+                del self._vectors[complaint_id]
+
+        items = [
+            (complaint_id, document) for complaint_id, document, metadata in rows
+            if metadata_filter is None or metadata_filter(json.loads(metadata))
+        ]
+        if not items:
+            return []
+
+        vectors = self._vectors_for(items)
+        candidates = [(i, document, vectors[i]) for i, document in items if i in vectors]
+        if not candidates:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        matrix = np.stack([c[2] for c in candidates])
+        distances = np.sum((matrix - query) ** 2, axis=1)
+
+        order = np.argsort(distances)[:k]
+        return [(candidates[i][0], candidates[i][1], float(distances[i])) for i in order]
+
+    def flush_once(self):
+        """
+        Flush up to batch_size pending complaints to the vector store.
+        Returns the number of complaints flushed.
+        """
+        with self._flush_lock, self._file_lock(exclusive=False):
+            return self._flush_batch()
+
+    def _claim(self, limit):
+        """Lease up to `limit` of the oldest complaints no other worker holds."""
+        now = time.time()
+        with self._lock:
+            with self._transaction() as conn:
+                rows = conn.execute(
+                    "SELECT id, document, metadata FROM queue "
+                    "WHERE lease_until IS NULL OR lease_until < ? ORDER BY seq LIMIT ?",
+                    (now, limit)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE queue SET lease_owner = ?, lease_until = ? WHERE id = ?",
+                    [(self._owner, now + self.lease_s, row[0]) for row in rows]
+                )
+        return [(complaint_id, document, json.loads(metadata)) for complaint_id, document, metadata in rows]
+
+    def _release(self, batch_ids):
+        """Give up this worker's lease so the rows can be retried."""
+        with self._lock:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "UPDATE queue SET lease_owner = NULL, lease_until = NULL WHERE id = ? AND lease_owner = ?",
+                    [(i, self._owner) for i in batch_ids]
+                )
+
+    def _write(self, rows):
+        """Embed and write the given (id, document, metadata) rows in one bulk call."""
+        vectors = self._vectors_for([(complaint_id, document) for complaint_id, document, _ in rows])
+        self.flush(
+            [document for _, document, _ in rows],
+            [complaint_id for complaint_id, _, _ in rows],
+            [metadata for _, _, metadata in rows],
+            [vectors[complaint_id].tolist() for complaint_id, _, _ in rows]
+        )
+
+    def _remove(self, batch_ids, conn):
+        conn.executemany("DELETE FROM queue WHERE id = ?", [(i,) for i in batch_ids])
+        for complaint_id in batch_ids:
+            self._vectors.pop(complaint_id, None)
+
+    def _flush_batch(self):
+        rows = self._claim(self.batch_size)
+        if not rows:
+            return 0
+
+        batch_ids = [row[0] for row in rows]
+        start = time.perf_counter()
+        try:
+            self._write(rows)
+        except Exception as e:
+            print(f"Ingest queue flush failed: {e}")
+            with self._lock:
+                self._stats['failed_batches'] += 1
+                self._stats['last_error'] = str(e)
+                with self._transaction() as conn:
+                    conn.executemany(
+                        "UPDATE queue SET attempts = attempts + 1 WHERE id = ?", [(i,) for i in batch_ids]
+                    )
+                    attempts = conn.execute(
+                        f"SELECT MAX(attempts) FROM queue WHERE id IN ({','.join('?' * len(batch_ids))})",
+                        batch_ids
+                    ).fetchone()[0] or 0
+
+            if attempts < self.max_attempts:
+                self._release(batch_ids)
+                raise
+            # The batch keeps failing: write it row by row to find the bad ones
+            return self._flush_individually(rows)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            with self._transaction() as conn:
+                self._remove(batch_ids, conn)
+            self._record_flush(len(batch_ids), elapsed_ms)
+
+        return len(batch_ids)
+
+    def _flush_individually(self, rows):
+        """
+        Write a repeatedly failing batch one complaint at a time. Complaints
+        that still fail are moved to the dead_letter table, but only when
+        others in the batch went through, so a vector store outage leaves
+        the queue intact instead of emptying it.
+        """
+        flushed, failed = [], []
+        for row in rows:
+            start = time.perf_counter()
+            try:
+                self._write([row])
+            except Exception as e:
+                failed.append((row[0], str(e)))
+                continue
+            with self._lock:
+                with self._transaction() as conn:
+                    self._remove([row[0]], conn)
+                self._record_flush(1, (time.perf_counter() - start) * 1000)
+            flushed.append(row[0])
+
+        if failed and not flushed:
+            self._release([complaint_id for complaint_id, _ in failed])
+            raise Exception(f"All {len(failed)} complaints in the batch failed: {failed[0][1]}")
+
+        now = time.time()
+        with self._lock:
+            with self._transaction() as conn:
+                for complaint_id, error in failed:
+                    print(f"Ingest queue moved complaint {complaint_id} to the dead-letter table: {error}")
+                    conn.execute(
+                        "INSERT OR REPLACE INTO dead_letter (id, document, metadata, enqueued_at, failed_at, attempts, error) "
+                        "SELECT id, document, metadata, enqueued_at, ?, attempts, ? FROM queue WHERE id = ?",
+                        (now, error, complaint_id)
+                    )
+                self._remove([complaint_id for complaint_id, _ in failed], conn)
+            self._stats['dead_lettered_total'] += len(failed)
+
+        return len(flushed) + len(failed)
+
+    def _record_flush(self, count, elapsed_ms):
+        self._stats['flushed_total'] += count
+        self._stats['batches'] += 1
+        self._stats['last_flush_ms'] = round(elapsed_ms, 2)
+        self._stats['total_flush_ms'] += elapsed_ms
+        if self._stats['max_flush_ms'] is None or elapsed_ms > self._stats['max_flush_ms']:
+            self._stats['max_flush_ms'] = round(elapsed_ms, 2)
+
+    @contextmanager
+    def paused(self):
+        """
+        Hold off background flushes in every process sharing the queue file,
+        e.g. while the store is being rebuilt.
+        """
+        with self._flush_lock, self._file_lock(exclusive=True):
+            yield
+
+    def drain(self):
+        """Flush everything that is currently pending and not leased elsewhere."""
+        while self.flush_once():
+            pass
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            self._wakeup.wait(timeout=backoff)
+            self._wakeup.clear()
+            try:
+                while self.flush_once() >= self.batch_size:
+                    pass
+                backoff = self.flush_interval
+            except Exception:
+                # Keep the rows queued and retry with a growing delay
+                backoff = min(max(backoff * 2, self.flush_interval), 30)
+
+    def depth(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def get_stats(self):
+        """
+        Report queue depth, flush latency and backpressure counters. Depths
+        cover every process sharing the queue file; counters are this
+        process's own.
+        """
+        now = time.time()
+        with self._lock:
+            stats = dict(self._stats)
+            depth, leased, oldest = self._conn.execute(
+                "SELECT COUNT(*), SUM(lease_until >= ?), MIN(enqueued_at) FROM queue", (now,)
+            ).fetchone()
+            dead_letter_depth = self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+        total_flush_ms = stats.pop('total_flush_ms')
+        stats['avg_flush_ms'] = round(total_flush_ms / stats['batches'], 2) if stats['batches'] else None
+        stats.update({
+            'depth': depth,
+            'leased': leased or 0,
+            'max_depth': self.max_depth,
+            'utilization': round(depth / self.max_depth, 3) if self.max_depth else None,
+            'batch_size': self.batch_size,
+            'flush_interval_s': self.flush_interval,
+            'oldest_pending_age_s': round(now - oldest, 3) if oldest else 0,
+            'worker_running': self._worker is not None and self._worker.is_alive(),
+            'max_attempts': self.max_attempts,
+            'dead_letter_depth': dead_letter_depth,
+        })
+        return stats
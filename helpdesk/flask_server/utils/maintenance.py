@@ -0,0 +1,460 @@
+import json
+import os
+import pickle
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: concurrent startup restores are not serialized
+    fcntl = None
+
+CHROMA_PATH = os.environ.get("CHROMA_STORAGE_PATH", "./chroma_storage")
+SNAPSHOT_DIR = os.environ.get("STORE_SNAPSHOT_DIR", "./snapshots")
+SNAPSHOT_KEEP = int(os.environ.get("STORE_SNAPSHOT_KEEP", 3))
+# Snapshot directory (or "latest") to load when a worker starts with an empty store
+RESTORE_SNAPSHOT = os.environ.get("STORE_RESTORE_SNAPSHOT", "")
+
+SQLITE_FILE = "chroma.sqlite3"
+MANIFEST_FILE = "manifest.json"
+_SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# Opens the store in a fresh process and times the first query on each collection
+_LOAD_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import chromadb
+client = chromadb.PersistentClient(path=sys.argv[1])
+opened = time.perf_counter()
+for c in client.list_collections():
+    collection = client.get_collection(getattr(c, 'name', c))
+    if collection.count():
+        sample = collection.get(limit=1, include=['embeddings'])['embeddings'][0]
+        collection.query(query_embeddings=[[float(x) for x in sample]], n_results=1)
+queried = time.perf_counter()
+print(json.dumps({'open_ms': round((opened - start) * 1000, 1),
+                  'first_query_ms': round((queried - opened) * 1000, 1),
+                  'total_ms': round((queried - start) * 1000, 1)}))
+"""
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _sqlite_stats(db_path):
+    """Size and free-page ratio of the Chroma SQLite file."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        'size_bytes': page_size * page_count,
+        'free_bytes': page_size * freelist,
+        'free_ratio': round(freelist / page_count, 4) if page_count else 0,
+    }
+
+
+def _segment_owners(db_path):
+    """
+    Map of segment id -> collection name from Chroma's own tables, or None
+    if the schema is not readable.
+    """
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT s.id, c.name FROM segments s JOIN collections c ON s.collection = c.id"
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Could not read segment table: {e}")
+        return None
+    return {segment_id: name for segment_id, name in rows}
+
+
+def _index_stats(segment_path):
+    """
+    Live vs. ever-added element counts from an HNSW segment's metadata.
+    Deleted elements stay in the index until it is rebuilt.
+    """
+    stats = {'size_bytes': _dir_size(segment_path)}
+    metadata_path = os.path.join(segment_path, "index_metadata.pickle")
+    if not os.path.exists(metadata_path):
+        return stats
+
+    try:
+        with open(metadata_path, "rb") as f:
+            metadata = pickle.load(f)
+        live = len(getattr(metadata, "id_to_label", {}) or {})
+        added = getattr(metadata, "total_elements_added", None) or live
+        stats.update({
+            'live_elements': live,
+            'allocated_elements': added,
+            'fragmentation': round(1 - live / added, 4) if added else 0,
+        })
+    except Exception as e:
+        stats['error'] = f"Could not read index metadata: {e}"
+    return stats
+
+
+def measure_load_time(path=CHROMA_PATH):
+    """Cold start to first query time of the store, measured in a new process."""
+    result = subprocess.run(
+        [sys.executable, "-c", _LOAD_PROBE, path],
+        capture_output=True, text=True, timeout=600
+    )
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'load probe failed'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def storage_report(path=CHROMA_PATH, measure_load=False):
+    """
+    On-disk size, SQLite free space, per-segment index fragmentation and
+    (optionally) cold load time of the store.
+    """
+    db_path = os.path.join(path, SQLITE_FILE)
+    report = {'path': path, 'total_bytes': _dir_size(path)}
+    if not os.path.exists(db_path):
+        report['error'] = 'Store not found'
+        return report
+
+    report['sqlite'] = _sqlite_stats(db_path)
+
+    owners = _segment_owners(db_path) or {}
+    segments = []
+    orphans = []
+    for entry in sorted(os.listdir(path)):
+        full_path = os.path.join(path, entry)
+        if not os.path.isdir(full_path) or not _SEGMENT_DIR.match(entry):
+            continue
+        if owners and entry not in owners:
+            orphans.append(entry)
+            continue
+        segments.append({'segment': entry, 'collection': owners.get(entry), **_index_stats(full_path)})
+
+    report['segments'] = segments
+    report['orphaned_segments'] = orphans
+    report['orphaned_bytes'] = sum(_dir_size(os.path.join(path, o)) for o in orphans)
+
+    allocated = sum(s.get('allocated_elements', 0) for s in segments)
+    live = sum(s.get('live_elements', 0) for s in segments)
+    report['index_fragmentation'] = round(1 - live / allocated, 4) if allocated else 0
+
+    if measure_load:
+        report['load_time'] = measure_load_time(path)
+    return report
+
+
+def _copy_collection(source, target, batch_size=500):
+    offset = 0
+    while True:
+        batch = source.get(
+            limit=batch_size,
+            offset=offset,
+            include=['documents', 'metadatas', 'embeddings']
+        )
+        if not batch['ids']:
+            break
+        target.add(
+            ids=batch['ids'],
+            documents=batch['documents'],
+            metadatas=batch['metadatas'],
+            embeddings=[[float(x) for x in e] for e in batch['embeddings']]
+        )
+        offset += len(batch['ids'])
+
+
+def _rebuild_collection(store, name):
+    """
+    Rebuild a collection's HNSW index from its live records by copying them
+    into a fresh collection that then takes over the original name. Writes
+    to the store wait until the swap is done, so none are lost.
+    """
+    client = store.client
+    temp_name = f"rebuild_{name}"[:63]
+
+    with store.write_lock:
+        source = client.get_collection(name, embedding_function=store.embedding_function)
+        metadata = source.metadata
+
+        try:
+            # Left over from a rebuild interrupted while the original still existed
+            client.delete_collection(temp_name)
+        except Exception:
+            pass
+
+        temp = client.create_collection(temp_name, metadata=metadata, embedding_function=store.embedding_function)
+        _copy_collection(source, temp)
+        if temp.count() != source.count():
+            client.delete_collection(temp_name)
+            raise RuntimeError(f"Rebuild of {name} copied {temp.count()} of {source.count()} records")
+
+        store.replace_collection(name, temp)
+        return temp.count()
+
+
+def _remove_orphaned_segments(path):
+    owners = _segment_owners(os.path.join(path, SQLITE_FILE))
+    if not owners:
+        # Without the segment table we cannot tell what is safe to remove
+        return []
+
+    removed = []
+    for entry in os.listdir(path):
+        full_path = os.path.join(path, entry)
+        if os.path.isdir(full_path) and _SEGMENT_DIR.match(entry) and entry not in owners:
+            shutil.rmtree(full_path)
+            removed.append(entry)
+    return removed
+
+
+def _vacuum(path):
+    conn = sqlite3.connect(os.path.join(path, SQLITE_FILE), timeout=60)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def compact_store(measure_load=False):
+    """
+    Rebuild every collection's vector index, drop orphaned segment files and
+    VACUUM the SQLite file. Ingest flushes are paused while this runs and
+    other writes in this process wait for the collection being rebuilt.
+    Searches may miss a collection for the moment its rebuild is swapped in.
+    """
+    from utils import store
+
+    before = storage_report(CHROMA_PATH, measure_load)
+    start = time.perf_counter()
+
+    with store.ingest_queue.paused():
+        with store.write_lock:
+            names = [getattr(c, 'name', c) for c in store.client.list_collections()]
+            for name in names:
+                original = name[len("rebuild_"):]
+                if name.startswith("rebuild_") and original not in names:
+                    # Interrupted after the original was dropped; finish the swap
+                    store.replace_collection(
+                        original,
+                        store.client.get_collection(name, embedding_function=store.embedding_function)
+                    )
+                    names.append(original)
+
+        # One collection at a time, so writes only wait for the one being rebuilt
+        rebuilt = {}
+        for name in names:
+            if not name.startswith("rebuild_"):
+                rebuilt[name] = _rebuild_collection(store, name)
+
+        with store.write_lock:
+            removed = _remove_orphaned_segments(CHROMA_PATH)
+            _vacuum(CHROMA_PATH)
+
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    after = storage_report(CHROMA_PATH, measure_load)
+    return {
+        'rebuilt_collections': rebuilt,
+        'removed_segments': removed,
+        'elapsed_ms': elapsed_ms,
+        'reclaimed_bytes': before['total_bytes'] - after['total_bytes'],
+        'before': before,
+        'after': after,
+    }
+
+
+def _list_snapshots(root=SNAPSHOT_DIR):
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        entry for entry in os.listdir(root)
+        if os.path.exists(os.path.join(root, entry, MANIFEST_FILE))
+    )
+
+
+def create_snapshot(root=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    """
+    Write a point-in-time copy of the store with all writes held off: the
+    segment files first, then an online SQLite backup, which is never older
+    than the segments so Chroma can replay anything they have not persisted.
+    Old snapshots beyond `keep` are removed.
+    """
+    from utils import store
+
+    # Timestamp first so names sort by age; the suffix keeps snapshots taken
+    # within the same second apart
+    now_ns = time.time_ns()
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(now_ns // 10**9))
+    name = f"{stamp}.{now_ns % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+    target = os.path.join(root, name)
+    partial = target + ".partial"
+    os.makedirs(partial)
+    start = time.perf_counter()
+
+    try:
+        with store.ingest_queue.paused(), store.write_lock:
+            for entry in os.listdir(CHROMA_PATH):
+                full_path = os.path.join(CHROMA_PATH, entry)
+                if os.path.isdir(full_path) and _SEGMENT_DIR.match(entry):
+                    shutil.copytree(full_path, os.path.join(partial, entry))
+
+            source = sqlite3.connect(os.path.join(CHROMA_PATH, SQLITE_FILE), timeout=60)
+            destination = sqlite3.connect(os.path.join(partial, SQLITE_FILE))
+            try:
+                source.backup(destination)
+            finally:
+                destination.close()
+                source.close()
+
+            collections = {}
+            for c in store.client.list_collections():
+                collection_name = getattr(c, 'name', c)
+                collections[collection_name] = store.client.get_collection(
+                    collection_name, embedding_function=store.embedding_function
+                ).count()
+
+        manifest = {
+            'name': name,
+            'created_at': time.time(),
+            'source': os.path.abspath(CHROMA_PATH),
+            'collections': collections,
+            'size_bytes': _dir_size(partial),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        }
+        with open(os.path.join(partial, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(partial, target)
+    except BaseException:
+        # Leave no half-written snapshot behind
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+    for old in _list_snapshots(root)[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(root, old))
+
+    manifest['path'] = target
+    return manifest
+
+
+def claim_store(path=CHROMA_PATH):
+    """
+    Lock the store for this process. Chroma's PersistentClient keeps each
+    collection's index in process memory and does not support several
+    processes on one store, so a second server worker, or a manage_store.py
+    command run next to the server, fails here instead of serving stale
+    results. Returns the lock file, which must stay open.
+    """
+    lock_path = f"{path.rstrip('/')}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    lock = open(lock_path, "a")
+    if fcntl is None:
+        return lock
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        raise RuntimeError(
+            f"The store at {path} is already open in another process. Run a single server "
+            f"process (use threads for concurrency) and stop it before running maintenance commands."
+        )
+    return lock
+
+
+def restore_snapshot(snapshot, target=CHROMA_PATH, root=SNAPSHOT_DIR):
+    """
+    Replace the store at `target` with a snapshot (a path, a snapshot name or
+    "latest"). The snapshot is copied next to the target and renamed into
+    place, so an interrupted restore never leaves a half-copied store. A
+    non-empty current store is kept alongside as a .bak directory.
+    Must run before the Chroma client is opened.
+    """
+    if snapshot == "latest":
+        snapshots = _list_snapshots(root)
+        if not snapshots:
+            raise FileNotFoundError(f"No snapshots found in {root}")
+        snapshot = snapshots[-1]
+    source = snapshot if os.path.isdir(snapshot) else os.path.join(root, snapshot)
+    if not os.path.exists(os.path.join(source, MANIFEST_FILE)):
+        raise FileNotFoundError(f"Not a store snapshot: {source}")
+
+    start = time.perf_counter()
+    target = target.rstrip('/')
+    staging = f"{target}.restoring-{os.getpid()}"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    shutil.copytree(source, staging, ignore=shutil.ignore_patterns(MANIFEST_FILE))
+
+    backup = None
+    if os.path.exists(target):
+        if os.listdir(target):
+            backup = f"{target}.bak-{time.strftime('%Y%m%dT%H%M%S')}"
+            os.rename(target, backup)
+        else:
+            os.rmdir(target)
+    os.rename(staging, target)
+
+    return {
+        'restored_from': source,
+        'target': target,
+        'previous_store': backup,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def restore_on_startup():
+    """
+    Load STORE_RESTORE_SNAPSHOT into an empty or missing store, so new workers
+    and nodes start from a compacted copy instead of rebuilding from scratch.
+    Workers starting together take a file lock so only the first one restores.
+    """
+    if not RESTORE_SNAPSHOT or os.path.exists(os.path.join(CHROMA_PATH, SQLITE_FILE)):
+        return None
+
+    lock_path = f"{CHROMA_PATH.rstrip('/')}.restore.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Another worker may have restored while this one waited
+            if os.path.exists(os.path.join(CHROMA_PATH, SQLITE_FILE)):
+                return None
+            result = restore_snapshot(RESTORE_SNAPSHOT)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    print(f"Restored store from snapshot {result['restored_from']} in {result['elapsed_ms']}ms")
+    return result
+
+
+def warm_up(get_collections):
+    """Run one query per collection so HNSW indexes are loaded before real traffic."""
+    start = time.perf_counter()
+    try:
+        for collection in get_collections():
+            if collection.count():
+                sample = collection.get(limit=1, include=['embeddings'])['embeddings'][0]
+                collection.query(query_embeddings=[[float(x) for x in sample]], n_results=1)
+        print(f"Store warm-up finished in {(time.perf_counter() - start) * 1000:.1f}ms")
+    except Exception as e:
+        print(f"Store warm-up failed: {e}")
@@ -1,10 +1,11 @@
 
 import google.generativeai as genai
 from config.model import model
+from utils.prompt_budget import build_history_section
 import json
 import re
 
-def simple_analyze_user(user_id, solved_queries, question):
+def simple_analyze_user(user_id, solved_queries, question, expertise_domain=None):
     """
     Simplified analysis that doesn't rely on JSON parsing
     """
@@ -13,13 +14,19 @@ def simple_analyze_user(user_id, solved_queries, question):
         print(f"Question: {question}")
         print(f"User has {len(solved_queries)} solved queries")
         
+        # Only the most relevant queries plus a cached summary go into the
+        # prompt, so its size stays bounded however long the history is
+        history_section, selected_queries = build_history_section(
+            user_id, solved_queries, question, expertise_domain
+        )
+        print(f"Using {len(selected_queries)} of {len(solved_queries)} solved queries in prompt")
+        
         prompt = f"""
         Rate how relevant this user is for the question on a scale of 0-10.
         
         Question: "{question}"
         
-        User's solved queries:
-        {chr(10).join([f"- {query}" for query in solved_queries])}
+        {history_section}
         
         Give me just a number from 0-10 where:
         - 10 = extremely relevant
@@ -100,7 +107,9 @@ def analyze_user_expertise(users_data, question):
             print(f"Analyzing user {user_id}...")
             
             # Use simple analysis by default - it's more reliable
-            user_result = simple_analyze_user(user_id, solved_queries, question)
+            user_result = simple_analyze_user(
+                user_id, solved_queries, question, user.get("expertise_domain")
+            )
             results.append(user_result)
         
         # Sort users by relevance score (highest first)
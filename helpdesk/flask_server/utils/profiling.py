@@ -0,0 +1,285 @@
+import functools
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import request
+
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN", "")
+# Fraction of requests to profiled endpoints that are sampled without a token
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 50))
+
+# Where time goes, matched against frame filenames from the innermost frame out
+CATEGORIES = [
+    ("llm", ("google/generativeai", "google/api_core", "grpc", "stub_model.py")),
+    ("embedding", ("sentence_transformers", "torch", "embedding_functions", "utils/embedding.py")),
+    ("vector_store", ("chromadb", "hnswlib")),
+]
+
+# Request thread time spent in Future.result() with no tracked helper thread to blame
+WAITING_CATEGORY = "waiting_on_worker_threads"
+
+_ENABLED = bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+_write_lock = threading.Lock()
+# The profiler of the request running on the current thread, if any
+_local = threading.local()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _classify(frame):
+    while frame is not None:
+        filename = frame.f_code.co_filename.replace("\\", "/")
+        for category, markers in CATEGORIES:
+            if any(marker in filename for marker in markers):
+                return category
+        frame = frame.f_back
+    return "cpu_or_other"
+
+
+def _waits_on_future(frame):
+    """True if the thread is blocked in Future.result() or futures.wait()."""
+    while frame is not None and frame.f_code.co_filename.replace("\\", "/").endswith("/threading.py"):
+        frame = frame.f_back
+    return frame is not None and frame.f_code.co_filename.replace("\\", "/").endswith("concurrent/futures/_base.py")
+
+
+def _fold(frame, root=None):
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    if root:
+        stack.append(root)
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """
+    Periodically samples the stack of the request thread, and of any pool
+    threads running work for the request, from a background thread, so the
+    profiled request runs its own code unmodified.
+
+    While the request thread waits on a future, its samples are attributed
+    to what the helper threads are doing at that moment.
+    """
+
+    def __init__(self, thread_id, interval_s):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self.categories = Counter()
+        # Busy time of helper threads, which can overlap the request thread
+        self.helper_categories = Counter()
+        self.samples = 0
+        self._helpers = {}
+        self._helpers_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def add_helper(self, thread_id, name):
+        with self._helpers_lock:
+            self._helpers[thread_id] = name
+
+    def remove_helper(self, thread_id):
+        with self._helpers_lock:
+            self._helpers.pop(thread_id, None)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            frame = frames.get(self.thread_id)
+            if frame is None:
+                continue
+
+            with self._helpers_lock:
+                helpers = [(tid, name) for tid, name in self._helpers.items() if tid in frames]
+
+            helper_categories = []
+            for tid, name in helpers:
+                category = _classify(frames[tid])
+                helper_categories.append(category)
+                self.helper_categories[category] += 1
+                self.stacks[_fold(frames[tid], root=name)] += 1
+
+            if not _waits_on_future(frame):
+                self.categories[_classify(frame)] += 1
+            elif helper_categories:
+                # Split the wait between the helpers the request is waiting for
+                for category in helper_categories:
+                    self.categories[category] += 1 / len(helper_categories)
+            else:
+                self.categories[WAITING_CATEGORY] += 1
+            self.stacks[_fold(frame)] += 1
+            self.samples += 1
+
+
+def profiled_task(fn):
+    """
+    Wrap a callable before submitting it to a thread pool during a request,
+    so a profiler running for that request also samples the pool thread.
+    Returns fn unchanged when the request is not being profiled.
+    """
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        thread_id = threading.get_ident()
+        profiler.add_helper(thread_id, threading.current_thread().name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.remove_helper(thread_id)
+
+    return run
+
+
+def is_admin_request():
+    # Header only, so the token does not end up in access logs or browser history
+    token = request.headers.get("X-Profile-Token", "")
+    return bool(PROFILE_ADMIN_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+
+def _should_profile():
+    if is_admin_request():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _prune_profiles():
+    summaries = sorted(
+        (f for f in os.listdir(PROFILE_DIR) if f.endswith(".json")),
+        key=lambda f: os.path.getmtime(os.path.join(PROFILE_DIR, f))
+    )
+    for name in summaries[:max(0, len(summaries) - PROFILE_MAX_FILES)]:
+        profile_id = name[:-len(".json")]
+        for suffix in (".json", ".folded"):
+            path = os.path.join(PROFILE_DIR, profile_id + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _save_profile(endpoint, profiler, wall_s, cpu_s, status):
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}_{re.sub(r'[^A-Za-z0-9_-]+', '_', endpoint).strip('_')}_{uuid.uuid4().hex[:8]}"
+
+    # Each sample stands for an equal share of the request's wall time
+    per_sample_ms = wall_s * 1000 / profiler.samples if profiler.samples else 0
+    summary = {
+        'id': profile_id,
+        'endpoint': endpoint,
+        'created_at': time.time(),
+        'status': status,
+        'wall_ms': round(wall_s * 1000, 2),
+        'cpu_ms': round(cpu_s * 1000, 2),
+        'blocked_ms': round(max(0.0, wall_s - cpu_s) * 1000, 2),
+        'samples': profiler.samples,
+        'interval_ms': PROFILE_INTERVAL_MS,
+        'wall_ms_by_category': {
+            category: round(count * per_sample_ms, 2)
+            for category, count in profiler.categories.most_common()
+        },
+        'helper_thread_ms_by_category': {
+            category: round(count * per_sample_ms, 2)
+            for category, count in profiler.helper_categories.most_common()
+        },
+    }
+
+    with _write_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, profile_id + ".folded"), "w") as f:
+            for stack, count in profiler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(PROFILE_DIR, profile_id + ".json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        _prune_profiles()
+
+    return profile_id
+
+
+def profiled(view):
+    """
+    Run a Flask view under the sampling profiler when the request carries
+    the admin token or is picked by PROFILE_SAMPLE_RATE.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _ENABLED or not _should_profile():
+            return view(*args, **kwargs)
+
+        profiler = SamplingProfiler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        profiler.start()
+        _local.profiler = profiler
+        status = None
+        try:
+            response = view(*args, **kwargs)
+            status = response[1] if isinstance(response, tuple) and len(response) > 1 else 200
+            return response
+        finally:
+            cpu_s = time.thread_time() - cpu_start
+            wall_s = time.perf_counter() - wall_start
+            _local.profiler = None
+            profiler.stop()
+            try:
+                profile_id = _save_profile(request.path, profiler, wall_s, cpu_s, status)
+                print(f"Saved profile {profile_id} ({wall_s * 1000:.1f}ms wall, {cpu_s * 1000:.1f}ms CPU)")
+            except Exception as e:
+                print(f"Failed to save profile: {e}")
+
+    return wrapper
+
+
+def list_profiles():
+    """Summaries of stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    profiles.sort(key=lambda p: p.get('created_at', 0), reverse=True)
+    return profiles
+
+
+def load_profile(profile_id, fmt="json"):
+    """
+    Contents of a stored profile: the summary (fmt="json") or the collapsed
+    stacks for flame graph tools (fmt="folded"). Returns None if missing.
+    """
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", profile_id):
+        return None
+
+    path = os.path.join(PROFILE_DIR, profile_id + (".folded" if fmt == "folded" else ".json"))
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return f.read() if fmt == "folded" else json.load(f)
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from utils.embedding import embedding_function
+
+# Approximate token budget for the solved-queries part of a prompt
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 400))
+# Queries at least this similar (cosine) to an already selected one are dropped
+PROMPT_DEDUPE_THRESHOLD = float(os.environ.get("PROMPT_DEDUPE_THRESHOLD", 0.92))
+PROMPT_SUMMARY_TOPICS = int(os.environ.get("PROMPT_SUMMARY_TOPICS", 8))
+# Approximate token allowance for the history summary appended after the selected queries
+PROMPT_SUMMARY_TOKENS = int(os.environ.get("PROMPT_SUMMARY_TOKENS", 80))
+EMBEDDING_CACHE_SIZE = int(os.environ.get("PROMPT_EMBEDDING_CACHE_SIZE", 50000))
+SUMMARY_CACHE_SIZE = int(os.environ.get("PROMPT_SUMMARY_CACHE_SIZE", 5000))
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "my", "not", "of", "on", "or", "the",
+    "to", "use", "using", "what", "when", "where", "which", "why", "with", "you",
+    "your", "properly", "fix", "issue", "issues", "problem", "problems",
+}
+
+# Topic words of 3-30 characters; longer runs (hashes, pasted blobs) are skipped whole
+TOPIC_PATTERN = re.compile(r"(?<![a-z0-9+#])[a-z0-9+#]{3,30}(?![a-z0-9+#])")
+
+_lock = threading.Lock()
+_embedding_cache = OrderedDict()
+_summary_cache = OrderedDict()
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English text)."""
+    return max(1, len(text) // 4)
+
+
+def _embed(texts):
+    """
+    Embed texts with an LRU cache so a user's history is only embedded once.
+    Returns an array of unit-normalised vectors.
+    """
+    with _lock:
+        missing = list(OrderedDict.fromkeys(t for t in texts if t not in _embedding_cache))
+
+    if missing:
+        vectors = np.asarray(embedding_function(missing), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        with _lock:
+            for text, vector in zip(missing, vectors):
+                _embedding_cache[text] = vector
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+
+    with _lock:
+        result = []
+        for text in texts:
+            vector = _embedding_cache.get(text)
+            if vector is None:
+                # Evicted between the two lock sections; embed it again
+                vector = np.asarray(embedding_function([text])[0], dtype=np.float32)
+                vector = vector / max(np.linalg.norm(vector), 1e-12)
+            else:
+                _embedding_cache.move_to_end(text)
+            result.append(vector)
+    return np.stack(result)
+
+
+def select_solved_queries(solved_queries, question, token_budget=None, dedupe_threshold=None):
+    """
+    Pick the solved queries most relevant to the question that fit in the
+    token budget, skipping near-duplicates of queries already picked.
+    """
+    if token_budget is None:
+        token_budget = PROMPT_TOKEN_BUDGET
+    if dedupe_threshold is None:
+        dedupe_threshold = PROMPT_DEDUPE_THRESHOLD
+
+    queries = [q.strip() for q in solved_queries if isinstance(q, str) and q.strip()]
+    if not queries or token_budget <= 0:
+        return []
+
+    # Exact duplicates never need an embedding pass
+    queries = list(OrderedDict.fromkeys(queries))
+
+    vectors = _embed(queries)
+    question_vector = _embed([question])[0]
+    similarities = vectors @ question_vector
+
+    selected = []
+    selected_vectors = []
+    used_tokens = 0
+
+    for index in np.argsort(-similarities):
+        query = queries[index]
+        cost = estimate_tokens(f"- {query}\n")
+        if used_tokens + cost > token_budget:
+            continue
+
+        vector = vectors[index]
+        if selected_vectors and float(np.max(np.stack(selected_vectors) @ vector)) >= dedupe_threshold:
+            continue
+
+        selected.append(query)
+        selected_vectors.append(vector)
+        used_tokens += cost
+
+        if token_budget - used_tokens < 4:
+            break
+
+    return selected
+
+
+def _history_key(user_id, solved_queries, expertise_domain):
+    digest = hashlib.sha1()
+    digest.update(str(expertise_domain).encode("utf-8"))
+    for query in solved_queries:
+        digest.update(b"\0")
+        digest.update(str(query).encode("utf-8"))
+    return (user_id, digest.hexdigest())
+
+
+def summarize_history(user_id, solved_queries, expertise_domain=None):
+    """
+    Compact, question-independent summary of a user's whole history: total
+    count and the most common topics, kept within PROMPT_SUMMARY_TOKENS.
+    Cached per user and history.
+    """
+    key = _history_key(user_id, solved_queries, expertise_domain)
+    with _lock:
+        if key in _summary_cache:
+            _summary_cache.move_to_end(key)
+            return _summary_cache[key]
+
+    topics = Counter()
+    for query in solved_queries:
+        words = set(TOPIC_PATTERN.findall(str(query).lower()))
+        topics.update(w for w in words if w not in STOPWORDS)
+
+    summary = f"Total solved queries: {len(solved_queries)}."
+    if expertise_domain:
+        summary += f" Expertise domain: {str(expertise_domain)[:100]}."
+
+    # Add topics only while they fit, then cut anything still over the allowance
+    top_topics = []
+    for topic, count in topics.most_common(PROMPT_SUMMARY_TOPICS):
+        candidate = top_topics + [f"{topic} ({count})"]
+        if estimate_tokens(f"{summary} Most frequent topics: {', '.join(candidate)}.") > PROMPT_SUMMARY_TOKENS:
+            break
+        top_topics = candidate
+    if top_topics:
+        summary += f" Most frequent topics: {', '.join(top_topics)}."
+    summary = summary[:PROMPT_SUMMARY_TOKENS * 4]
+
+    with _lock:
+        _summary_cache[key] = summary
+        while len(_summary_cache) > SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+
+    return summary
+
+
+def precompute_user_summaries(users_data):
+    """Warm the summary and embedding caches for a list of user objects."""
+    for user in users_data:
+        solved_queries = user.get("Solved queries", [])
+        summarize_history(user.get("userId", "Unknown"), solved_queries, user.get("expertise_domain"))
+        if solved_queries:
+            _embed([q.strip() for q in solved_queries if isinstance(q, str) and q.strip()])
+
+
+def build_history_section(user_id, solved_queries, question, expertise_domain=None, token_budget=None):
+    """
+    Build the bounded solved-queries part of the relevance prompt.
+    Returns (prompt_text, selected_queries).
+    """
+    selected = select_solved_queries(solved_queries, question, token_budget)
+    summary = summarize_history(user_id, solved_queries, expertise_domain)
+
+    lines = [f"User's most relevant solved queries ({len(selected)} of {len(solved_queries)}):"]
+    lines.extend(f"- {query}" for query in selected)
+    lines.append("")
+    lines.append(f"Summary of the user's full history: {summary}")
+
+    return "\n".join(lines), selected
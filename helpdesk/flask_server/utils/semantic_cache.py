@@ -0,0 +1,248 @@
+import os
+import random
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from utils.embedding import embedding_function
+from utils.store import with_collection, write_lock
+
+CACHE_ENABLED = os.environ.get("RESOLVE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Minimum cosine similarity between queries to reuse a stored response
+CACHE_THRESHOLD = float(os.environ.get("RESOLVE_CACHE_THRESHOLD", 0.9))
+CACHE_TTL_S = float(os.environ.get("RESOLVE_CACHE_TTL_S", 7 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get("RESOLVE_CACHE_MAX_ENTRIES", 5000))
+# Fraction of hits that are regenerated in the background to check the cached answer
+CACHE_AUDIT_RATE = float(os.environ.get("RESOLVE_CACHE_AUDIT_RATE", 0.02))
+# Audited responses less similar than this to a fresh answer count as false hits
+CACHE_AUDIT_MIN_SIMILARITY = float(os.environ.get("RESOLVE_CACHE_AUDIT_MIN_SIMILARITY", 0.75))
+
+CACHE_COLLECTION = "resolve_cache"
+
+_lock = threading.Lock()
+_inserts_since_evict = 0
+# Held while a background eviction runs, so at most one runs at a time
+_evicting = threading.Lock()
+_stats = {
+    'lookups': 0,
+    'hits': 0,
+    'misses': 0,
+    'expired': 0,
+    'inserts': 0,
+    'evictions': 0,
+    'audits': 0,
+    'suspected_false_hits': 0,
+    'reported_false_hits': 0,
+}
+
+
+def _on_cache(action):
+    # Looked up each time, and again by name if the collection was rebuilt
+    return with_collection(CACHE_COLLECTION, action, metadata={"hnsw:space": "cosine"})
+
+
+def _count(name, amount=1):
+    with _lock:
+        _stats[name] += amount
+
+
+def _embed(text):
+    return [float(x) for x in embedding_function([text])[0]]
+
+
+def _lookup(query_embedding):
+    """
+    Closest cached entry as (id, response, similarity, created_at), or None.
+    """
+    try:
+        results = _on_cache(lambda collection: collection.query(
+            query_embeddings=[query_embedding],
+            n_results=1,
+            include=['metadatas', 'distances']
+        ) if collection.count() else None)
+    except Exception as e:
+        # E.g. the collection was swapped out by a rebuild mid-lookup
+        print(f"Resolve cache lookup failed: {e}")
+        return None
+    if not results or not results['ids'] or not results['ids'][0]:
+        return None
+
+    metadata = results['metadatas'][0][0] or {}
+    # Cosine space: distance = 1 - cosine similarity
+    similarity = 1 - results['distances'][0][0]
+    return results['ids'][0][0], metadata.get('response'), similarity, metadata.get('created_at', 0)
+
+
+def _insert(query, query_embedding, response):
+    global _inserts_since_evict
+
+    with write_lock:
+        _on_cache(lambda collection: collection.add(
+            ids=[str(uuid.uuid4())],
+            documents=[query],
+            embeddings=[query_embedding],
+            metadatas=[{'response': response, 'created_at': time.time()}]
+        ))
+    _count('inserts')
+
+    with _lock:
+        _inserts_since_evict += 1
+        should_evict = _inserts_since_evict >= max(1, CACHE_MAX_ENTRIES // 20)
+        if should_evict:
+            _inserts_since_evict = 0
+
+    if should_evict:
+        _evict_in_background()
+
+
+def _evict_in_background():
+    if not _evicting.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            evict()
+        except Exception as e:
+            print(f"Resolve cache eviction failed: {e}")
+        finally:
+            _evicting.release()
+
+    threading.Thread(target=run, name="resolve-cache-evict", daemon=True).start()
+
+
+def evict():
+    """
+    Drop expired entries, then the oldest ones until the cache is within
+    CACHE_MAX_ENTRIES. Returns the number of entries removed.
+    """
+    # Expired entries are found by a metadata filter, without loading replies
+    cutoff = time.time() - CACHE_TTL_S
+    expired = _on_cache(lambda collection: collection.get(
+        where={'created_at': {'$lt': cutoff}},
+        include=[]
+    ))['ids']
+    if expired:
+        with write_lock:
+            _on_cache(lambda collection: collection.delete(ids=expired))
+
+    overflow = []
+    if _on_cache(lambda collection: collection.count()) > CACHE_MAX_ENTRIES:
+        # Rare with periodic eviction; only then are the entries' ages loaded
+        entries = _on_cache(lambda collection: collection.get(include=['metadatas']))
+        aged = sorted(
+            zip(entries['ids'], [(m or {}).get('created_at', 0) for m in entries['metadatas']]),
+            key=lambda entry: entry[1]
+        )
+        overflow = [i for i, _ in aged[:max(0, len(aged) - CACHE_MAX_ENTRIES)]]
+        if overflow:
+            with write_lock:
+                _on_cache(lambda collection: collection.delete(ids=overflow))
+
+    removed = len(expired) + len(overflow)
+    if removed:
+        _count('evictions', removed)
+    return removed
+
+
+def _audit(entry_id, query, cached_response, generate):
+    """
+    Regenerate an answer for a cache hit and compare it with the cached one.
+    Entries whose answers diverge are counted as false hits and removed.
+    """
+    try:
+        fresh_response = generate(query)
+        vectors = np.asarray(embedding_function([cached_response, fresh_response]), dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = float(vectors[0] @ vectors[1])
+        _count('audits')
+
+        if similarity < CACHE_AUDIT_MIN_SIMILARITY:
+            print(f"Resolve cache audit: false hit for '{query[:80]}' (similarity {similarity:.3f})")
+            _count('suspected_false_hits')
+            with write_lock:
+                _on_cache(lambda collection: collection.delete(ids=[entry_id]))
+    except Exception as e:
+        print(f"Resolve cache audit failed: {e}")
+
+
+def cached_resolve(query, generate):
+    """
+    Return (response, cache_info) for a complaint query, reusing a stored
+    response for a sufficiently similar earlier query and calling
+    generate(query) otherwise.
+    """
+    if not CACHE_ENABLED:
+        return generate(query), {'cached': False}
+
+    try:
+        query_embedding = _embed(query)
+    except Exception as e:
+        print(f"Resolve cache skipped, embedding failed: {e}")
+        return generate(query), {'cached': False}
+    _count('lookups')
+
+    entry = _lookup(query_embedding)
+    if entry is not None:
+        entry_id, response, similarity, created_at = entry
+        if response and similarity >= CACHE_THRESHOLD:
+            if time.time() - created_at <= CACHE_TTL_S:
+                _count('hits')
+                if random.random() < CACHE_AUDIT_RATE:
+                    threading.Thread(
+                        target=_audit,
+                        args=(entry_id, query, response, generate),
+                        daemon=True
+                    ).start()
+                return response, {'cached': True, 'cache_id': entry_id, 'similarity': round(similarity, 3)}
+
+            _count('expired')
+            try:
+                with write_lock:
+                    _on_cache(lambda collection: collection.delete(ids=[entry_id]))
+            except Exception as e:
+                print(f"Resolve cache could not drop expired entry {entry_id}: {e}")
+
+    _count('misses')
+    response = generate(query)
+    try:
+        _insert(query, query_embedding, response)
+    except Exception as e:
+        # The reply is already generated; a failed cache write must not fail the request
+        print(f"Resolve cache insert failed: {e}")
+    return response, {'cached': False}
+
+
+def report_false_hit(entry_id):
+    """
+    Remove an entry that served a wrong answer and count it.
+    Returns True if the entry existed.
+    """
+    with write_lock:
+        existing = _on_cache(lambda collection: collection.get(ids=[entry_id]))
+        if not existing['ids']:
+            return False
+        _on_cache(lambda collection: collection.delete(ids=[entry_id]))
+    _count('reported_false_hits')
+    return True
+
+
+def get_cache_stats():
+    """Hit rate, eviction and false-hit audit counters for the resolve cache."""
+    with _lock:
+        stats = dict(_stats)
+
+    served = stats['hits'] + stats['misses']
+    stats.update({
+        'enabled': CACHE_ENABLED,
+        'entries': _on_cache(lambda collection: collection.count()),
+        'max_entries': CACHE_MAX_ENTRIES,
+        'threshold': CACHE_THRESHOLD,
+        'ttl_s': CACHE_TTL_S,
+        'hit_rate': round(stats['hits'] / served, 4) if served else None,
+        'false_hit_rate': round(
+            (stats['suspected_false_hits'] + stats['reported_false_hits']) / stats['hits'], 4
+        ) if stats['hits'] else None,
+    })
+    return stats
@@ -0,0 +1,50 @@
+import hashlib
+import os
+import re
+import zlib
+
+BASE_COLLECTION = "complaints"
+
+# "" keeps everything in one collection, "hash" spreads complaints by id,
+# any other value is used as the metadata key to shard by (e.g. "category")
+SHARD_BY = os.environ.get("STORE_SHARD_BY", "").strip()
+SHARD_COUNT = int(os.environ.get("STORE_SHARD_COUNT", 4))
+
+
+def is_sharded():
+    return bool(SHARD_BY)
+
+
+def _sanitize(value):
+    """
+    Turn a metadata value into a valid Chroma collection name suffix
+    (letters, digits, underscores and hyphens, bounded length).
+    """
+    text = re.sub(r"[^a-z0-9_-]+", "_", str(value).strip().lower()).strip("_-")
+    if not text:
+        text = "x"
+    if len(text) > 40:
+        digest = hashlib.sha1(str(value).encode("utf-8")).hexdigest()[:8]
+        text = f"{text[:31].rstrip('_-')}_{digest}"
+    return text
+
+
+def shard_for_value(value):
+    """Collection name for a value of the shard key (metadata sharding only)."""
+    if value is None or value == "":
+        # Complaints without the key stay in the original collection
+        return BASE_COLLECTION
+    return f"{BASE_COLLECTION}_{_sanitize(value)}"
+
+
+def shard_for(complaint_id, metadata):
+    """Collection name a complaint belongs in under the current configuration."""
+    if not SHARD_BY:
+        return BASE_COLLECTION
+    if SHARD_BY == "hash":
+        return f"{BASE_COLLECTION}_h{zlib.crc32(complaint_id.encode('utf-8')) % SHARD_COUNT}"
+    return shard_for_value((metadata or {}).get(SHARD_BY))
+
+
+def is_complaint_shard(name):
+    return name == BASE_COLLECTION or name.startswith(f"{BASE_COLLECTION}_")
@@ -1,16 +1,141 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from utils.embedding import embedding_function
+from utils.ingest_queue import IngestQueue, QueueFullError
+from utils import sharding
+from utils.maintenance import CHROMA_PATH, claim_store, restore_on_startup, warm_up
+from utils.profiling import profiled_task
 
-# Set persistent storage directory - Updated for new ChromaDB API
-client = chromadb.PersistentClient(path="./chroma_storage")
+# A new worker or node can start from a snapshot instead of an empty store
+restore_on_startup()
+
+# Chroma's local store supports one process; fail fast on a second one
+_store_lock = claim_store()
 
-embedding_function = SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+# Set persistent storage directory - Updated for new ChromaDB API
+client = chromadb.PersistentClient(path=CHROMA_PATH)
 
 collection = client.get_or_create_collection(
     name="complaints",
     embedding_function=embedding_function
 )
 
+_shards = {sharding.BASE_COLLECTION: collection}
+_shards_lock = threading.Lock()
+
+# Taken by every write to the store, and by snapshots and rebuilds so they
+# see no concurrent inserts or deletes
+write_lock = threading.RLock()
+
+# Shard queries run in parallel; each one mostly waits on Chroma/hnswlib
+_query_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("STORE_QUERY_WORKERS", 8)),
+    thread_name_prefix="shard-query"
+)
+
+def get_collection(name, metadata=None):
+    """
+    Get (or create) a collection by name, caching the handle.
+    """
+    with _shards_lock:
+        handle = _shards.get(name)
+        if handle is None:
+            handle = client.get_or_create_collection(
+                name=name,
+                embedding_function=embedding_function,
+                metadata=metadata
+            )
+            _shards[name] = handle
+        return handle
+
+def forget_collection(name):
+    """
+    Drop a cached handle, e.g. after the collection was deleted or rebuilt.
+    """
+    with _shards_lock:
+        _shards.pop(name, None)
+
+def get_shard(name):
+    """
+    Get (or create) the collection for a shard, caching the handle.
+    Only for writes; reads use find_shard.
+    """
+    return get_collection(name)
+
+def find_shard(name):
+    """
+    Cached handle for a shard that already exists, or None. Never creates
+    the collection, so a search for an unknown shard value leaves no empty
+    collection behind.
+    """
+    with _shards_lock:
+        handle = _shards.get(name)
+        if handle is None:
+            try:
+                handle = client.get_collection(name=name, embedding_function=embedding_function)
+            except Exception as e:
+                if not _is_missing_collection(e):
+                    raise
+                return None
+            _shards[name] = handle
+        return handle
+
+def _is_missing_collection(error):
+    # Chroma raises ValueError, InvalidCollectionException or NotFoundError depending on the version
+    return "does not exist" in str(error) or type(error).__name__ in ("NotFoundError", "InvalidCollectionException")
+
+def with_collection(name, action, create=True, metadata=None):
+    """
+    Run action(handle) on a collection and return its result. If the cached
+    handle points at a collection that no longer exists, e.g. one rebuilt by
+    compaction, the handle is dropped and the collection looked up again by
+    name once. With create=False, returns None if the collection is missing.
+    """
+    lookup = (lambda: get_collection(name, metadata)) if create else (lambda: find_shard(name))
+    handle = lookup()
+    if handle is None:
+        return None
+    try:
+        return action(handle)
+    except Exception as e:
+        if not _is_missing_collection(e):
+            raise
+        print(f"Collection {name} was replaced, looking it up again")
+        forget_collection(name)
+        handle = lookup()
+        return action(handle) if handle is not None else None
+
+def replace_collection(name, replacement):
+    """
+    Drop collection `name` and rename `replacement` to take its place.
+    Handle lookups wait for the swap, so no reader gets a handle to the
+    dropped collection or re-creates it in between.
+    """
+    with _shards_lock:
+        old_name = replacement.name
+        try:
+            client.delete_collection(name)
+        except Exception:
+            # Already dropped by an interrupted swap
+            pass
+        replacement.modify(name=name)
+        _shards.pop(old_name, None)
+        _shards[name] = replacement
+
+def list_shard_names():
+    """
+    Names of all complaint collections that currently exist in the store.
+    """
+    names = []
+    for c in client.list_collections():
+        # Older Chroma returns Collection objects, newer returns names
+        name = getattr(c, 'name', c)
+        if sharding.is_complaint_shard(name):
+            names.append(name)
+    return sorted(names)
+
 def add_complaint(complaint: str, complaint_id: str, metadata=None):
     """
     Add a complaint to the vector database with optional metadata.
@@ -19,19 +144,103 @@ def add_complaint(complaint: str, complaint_id: str, metadata=None):
         # ChromaDB requires non-empty metadata, so we provide a default
         metadata = {"type": "complaint"}
     
-    collection.add(
-        documents=[complaint], 
-        ids=[complaint_id],
-        metadatas=[metadata]
-    )
+    with write_lock:
+        with_collection(sharding.shard_for(complaint_id, metadata), lambda shard: shard.add(
+            documents=[complaint], 
+            ids=[complaint_id],
+            metadatas=[metadata]
+        ))
     # No need to call client.persist() with PersistentClient
 
+def add_complaints_batch(documents, ids, metadatas, embeddings=None):
+    """
+    Add several complaints in one bulk write. Used by the ingest queue worker
+    with embeddings that were already computed in a single batch. Upserts,
+    so a batch that is flushed again after an expired lease is harmless.
+    """
+    metadatas = [m if m else {"type": "complaint"} for m in metadatas]
+
+    # One bulk add per shard
+    groups = {}
+    for i, complaint_id in enumerate(ids):
+        groups.setdefault(sharding.shard_for(complaint_id, metadatas[i]), []).append(i)
+
+    for name, indexes in groups.items():
+        batch = {
+            'documents': [documents[i] for i in indexes],
+            'ids': [ids[i] for i in indexes],
+            'metadatas': [metadatas[i] for i in indexes],
+        }
+        if embeddings is not None:
+            batch['embeddings'] = [embeddings[i] for i in indexes]
+        with write_lock:
+            with_collection(name, lambda shard: shard.upsert(**batch))
+
+# Write-behind queue so /add_complaint does not embed and write inline
+ingest_queue = IngestQueue(
+    path=os.environ.get("INGEST_QUEUE_PATH", "./ingest_queue.sqlite3"),
+    flush=add_complaints_batch,
+    embed=embedding_function,
+    batch_size=int(os.environ.get("INGEST_BATCH_SIZE", 32)),
+    flush_interval=float(os.environ.get("INGEST_FLUSH_INTERVAL", 0.5)),
+    max_depth=int(os.environ.get("INGEST_MAX_DEPTH", 1000)),
+    max_attempts=int(os.environ.get("INGEST_MAX_ATTEMPTS", 3)),
+    lease_s=float(os.environ.get("INGEST_LEASE_S", 60))
+)
+ingest_queue.start()
+
+if os.environ.get("STORE_WARMUP", "true").lower() in ("1", "true", "yes"):
+    # Load the HNSW indexes in the background so the first search is not cold
+    threading.Thread(
+        target=warm_up,
+        args=(lambda: [h for h in map(find_shard, list_shard_names()) if h is not None],),
+        name="store-warmup",
+        daemon=True
+    ).start()
+
+def validate_metadata(metadata):
+    """
+    Raise ValueError unless metadata is a flat dict of scalar values that
+    the vector store accepts.
+    """
+    if not isinstance(metadata, dict):
+        raise ValueError("Metadata must be an object")
+    for key, value in metadata.items():
+        if not isinstance(key, str):
+            raise ValueError(f"Metadata keys must be strings, got {key!r}")
+        if not isinstance(value, (str, int, float, bool)):
+            raise ValueError(
+                f"Metadata field '{key}' must be a string, number or boolean, got {type(value).__name__}"
+            )
+
+def enqueue_complaint(complaint: str, complaint_id: str, metadata=None, embedding=None):
+    """
+    Queue a complaint for background insertion. It is searchable immediately.
+    Raises ValueError for metadata the vector store would reject and
+    QueueFullError when the queue is at its backpressure limit.
+    """
+    if metadata is None or len(metadata) == 0:
+        metadata = {"type": "complaint"}
+
+    # Reject bad records here instead of letting them fail every flush
+    validate_metadata(metadata)
+    if not isinstance(complaint, str) or not complaint:
+        raise ValueError("Complaint text must be a non-empty string")
+
+    ingest_queue.enqueue(complaint, complaint_id, metadata, embedding=embedding)
+
+def get_ingest_stats():
+    """
+    Queue depth, flush latency and backpressure counters for the ingest queue.
+    """
+    return ingest_queue.get_stats()
+
 def search_complaints(query: str, k=5):
     """
     Search for semantically similar complaints using vector similarity.
     Returns only complaints that are meaningfully related to the query.
     """
-    results = collection.query(
+    results = get_shard(sharding.BASE_COLLECTION).query(
         query_texts=[query], 
         n_results=k,
         # Add metadata filtering if needed
@@ -60,36 +269,86 @@ def search_complaints(query: str, k=5):
         'distances': [filtered_distances]
     }
 
-def search_similar_complaints(query: str, k=5, threshold=0.8):
+def _query_shard(name, query_embedding, k):
+    """
+    Top-k (id, document, distance) matches from a single shard; none if the
+    shard does not exist.
+    """
+    try:
+        results = with_collection(name, lambda shard: shard.query(
+            query_embeddings=[query_embedding], 
+            n_results=k
+        ), create=False)
+    except Exception as e:
+        # An empty or unreadable shard should not fail the whole search
+        print(f"Query on shard {name} failed: {e}")
+        return []
+
+    matches = []
+    if results and results['distances'] and len(results['distances'][0]) > 0:
+        for i, distance in enumerate(results['distances'][0]):
+            matches.append((results['ids'][0][i], results['documents'][0][i], distance))
+    return matches
+
+def search_similar_complaints(query: str, k=5, threshold=0.8, shard=None, query_embedding=None):
     """
     Search for semantically similar complaints with detailed similarity information.
     Returns complaints with similarity scores and better formatting.
+
+    When the store is sharded by a metadata key, `shard` restricts the search
+    to complaints with that key value; otherwise every shard is searched in
+    parallel and the results are merged by distance.
     """
-    results = collection.query(
-        query_texts=[query], 
-        n_results=k
-    )
+    # Embed once and reuse the vector for every shard and the pending buffer
+    if query_embedding is None:
+        query_embedding = embedding_function([query])[0]
+    query_embedding = [float(x) for x in query_embedding]
+
+    if shard is not None and sharding.SHARD_BY not in ("", "hash"):
+        shard_names = [sharding.shard_for_value(shard)]
+        pending_filter = lambda metadata: sharding.shard_for_value(metadata.get(sharding.SHARD_BY)) == shard_names[0]
+    else:
+        shard_names = list_shard_names() or [sharding.BASE_COLLECTION]
+        pending_filter = None
+
+    # Read the ingest queue before the shards: a complaint flushed in between
+    # is then found in the shards instead of being missed by both reads
+    pending = ingest_queue.search_pending(query_embedding, k, metadata_filter=pending_filter)
+
+    if len(shard_names) == 1:
+        matches = _query_shard(shard_names[0], query_embedding, k)
+    else:
+        query_shard = profiled_task(_query_shard)
+        futures = [_query_pool.submit(query_shard, name, query_embedding, k) for name in shard_names]
+        matches = [m for future in futures for m in future.result()]
+
+    seen_ids = {m[0] for m in matches}
+    for match in pending:
+        if match[0] not in seen_ids:
+            matches.append(match)
+    matches.sort(key=lambda m: m[2])
+    matches = matches[:k]
     
     similar_complaints = []
     
-    if results['distances'] and len(results['distances'][0]) > 0:
+    if matches:
         # Debug: Print all results to see what we're getting
         print(f"Search query: {query}")
-        print(f"Found {len(results['distances'][0])} results")
+        print(f"Found {len(matches)} results")
         
-        for i, distance in enumerate(results['distances'][0]):
+        for i, (complaint_id, document, distance) in enumerate(matches):
             # Convert distance to similarity score (1 - distance for better UX)
             similarity_score = max(0, 1 - distance)
             
             print(f"Result {i+1}: distance={distance:.3f}, similarity={similarity_score:.3f}")
-            print(f"Text: {results['documents'][0][i][:100]}...")
+            print(f"Text: {document[:100]}...")
             
             # Use a more lenient threshold - 1.2 instead of 0.8
             # ChromaDB distance can be > 1.0 for very different content
             if distance <= 1.2:  # More lenient threshold
                 similar_complaints.append({
-                    'id': results['ids'][0][i],
-                    'complaint': results['documents'][0][i],
+                    'id': complaint_id,
+                    'complaint': document,
                     'similarity_score': round(similarity_score, 3),
                     'distance': round(distance, 3)
                 })
@@ -108,22 +367,99 @@ def get_all_complaints():
     Get all complaints in the database for debugging purposes.
     """
     try:
-        # Get all documents from the collection
-        results = collection.get()
-        return {
-            'total_complaints': len(results['ids']),
-            'complaints': [
+        # Get all documents from every shard
+        complaints = []
+        for name in list_shard_names():
+            results = with_collection(name, lambda shard: shard.get(), create=False)
+            if results is None:
+                continue
+            complaints.extend(
                 {
                     'id': results['ids'][i],
                     'text': results['documents'][i],
                     'metadata': results['metadatas'][i] if results['metadatas'] else {}
                 }
                 for i in range(len(results['ids']))
-            ]
+            )
+        return {
+            'total_complaints': len(complaints),
+            'complaints': complaints
         }
     except Exception as e:
         return {'error': str(e)}
 
+def get_shard_stats():
+    """
+    Shard configuration and the number of complaints in each shard.
+    """
+    shards = []
+    for name in list_shard_names():
+        count = with_collection(name, lambda shard: shard.count(), create=False)
+        if count is not None:
+            shards.append({'name': name, 'count': count})
+    return {
+        'shard_by': sharding.SHARD_BY or None,
+        'shard_count': sharding.SHARD_COUNT if sharding.SHARD_BY == 'hash' else len(shards),
+        'total_complaints': sum(s['count'] for s in shards),
+        'shards': shards
+    }
+
+def rebalance_shards(batch_size=500, dry_run=False):
+    """
+    Move every complaint into the shard it belongs in under the current
+    sharding configuration, then drop shards that end up empty.
+    """
+    moved = {}
+    for name in list_shard_names():
+        source = get_shard(name)
+        offset = 0
+        while True:
+            batch = source.get(
+                limit=batch_size,
+                offset=offset,
+                include=['documents', 'metadatas', 'embeddings']
+            )
+            if not batch['ids']:
+                break
+
+            groups = {}
+            for i, complaint_id in enumerate(batch['ids']):
+                target = sharding.shard_for(complaint_id, batch['metadatas'][i])
+                if target != name:
+                    groups.setdefault(target, []).append(i)
+
+            stayed = len(batch['ids']) - sum(len(v) for v in groups.values())
+            for target, indexes in groups.items():
+                ids = [batch['ids'][i] for i in indexes]
+                moved[f"{name} -> {target}"] = moved.get(f"{name} -> {target}", 0) + len(ids)
+                if dry_run:
+                    continue
+                # Move each group atomically with respect to snapshots
+                with write_lock:
+                    get_shard(target).upsert(
+                        ids=ids,
+                        documents=[batch['documents'][i] for i in indexes],
+                        metadatas=[batch['metadatas'][i] for i in indexes],
+                        embeddings=[list(batch['embeddings'][i]) for i in indexes]
+                    )
+                    source.delete(ids=ids)
+
+            # Moved rows are gone from the source, so only skip the ones that stayed
+            offset += len(batch['ids']) if dry_run else stayed
+
+        if not dry_run and name != sharding.BASE_COLLECTION:
+            with write_lock:
+                if source.count() == 0:
+                    forget_collection(name)
+                    client.delete_collection(name)
+
+    return {
+        'dry_run': dry_run,
+        'moved': moved,
+        'total_moved': sum(moved.values()),
+        'shards': get_shard_stats()['shards']
+    }
+
 def enhanced_search_complaints(query: str, k=5):
     """
     Enhanced search that tries multiple query variations to find relevant complaints.
@@ -21,27 +21,39 @@ exports.createTicket = async (req, res) => {
       status: "Open"
     };
 
-    // Get priority score from Flask server
+    // Triage with the Flask server: priority score, summary and saving the
+    // complaint for semantic search happen in a single call
+    const complaint = {
+      text: `${req.body.title}: ${req.body.description}`,
+      category: req.body.category,
+      timestamp: new Date().toISOString(),
+      user_id: req.user.userId
+    };
+    let queued = false;
     try {
-      const priorityResponse = await axios.post(`${FLASK_SERVER_URL}/priority_score`, {
-        text: `${req.body.title} ${req.body.description}`
-      });
-      ticketData.priority = priorityResponse.data.priority_score || 1;
+      const triageResponse = await axios.post(`${FLASK_SERVER_URL}/triage`, complaint);
+      ticketData.priority = triageResponse.data.priority_score || 1;
+      if (triageResponse.data.summary) {
+        ticketData.summary = triageResponse.data.summary;
+      }
+      if (triageResponse.data.suggested_category) {
+        ticketData.suggestedCategory = triageResponse.data.suggested_category;
+      }
+      queued = triageResponse.data.queued === true;
     } catch (error) {
-      console.warn("Failed to get priority score:", error.message);
+      console.warn("Failed to triage ticket:", error.message);
       ticketData.priority = 1; // Default priority
+      // The complaint may have been saved even though the model call failed
+      queued = Boolean(error.response && error.response.data && error.response.data.queued);
     }
 
-    // Save complaint to Flask server for semantic search
-    try {
-      await axios.post(`${FLASK_SERVER_URL}/add_complaint`, {
-        text: `${req.body.title}: ${req.body.description}`,
-        category: req.body.category,
-        timestamp: new Date().toISOString(),
-        user_id: req.user.userId
-      });
-    } catch (error) {
-      console.warn("Failed to save complaint to Flask server:", error.message);
+    // Save complaint to Flask server for semantic search if triage did not
+    if (!queued) {
+      try {
+        await axios.post(`${FLASK_SERVER_URL}/add_complaint`, complaint);
+      } catch (error) {
+        console.warn("Failed to save complaint to Flask server:", error.message);
+      }
     }
 
     // Handle file upload to Azure Blob Storage
@@ -530,7 +542,7 @@ exports.getPriorityUsers = async (req, res) => {
   }
 };
 
-// Get ticket summary using Flask server
+// Get ticket summary, generated at triage or by the Flask server
 exports.getTicketSummary = async (req, res) => {
   try {
     const { ticketId } = req.params;
@@ -540,6 +552,19 @@ exports.getTicketSummary = async (req, res) => {
       return res.status(404).json({ message: "Ticket not found" });
     }
 
+    // Triaged tickets already carry a summary; only older ones need a model call
+    if (ticket.summary) {
+      return res.json({
+        ticket: {
+          id: ticket._id,
+          title: ticket.title,
+          status: ticket.status,
+          priority: ticket.priority
+        },
+        summary: ticket.summary
+      });
+    }
+
     try {
       const response = await axios.post(`${FLASK_SERVER_URL}/summarize`, {
         text: `Title: ${ticket.title}\nDescription: ${ticket.description}\nStatus: ${ticket.status}\nPriority: ${ticket.priority}`
@@ -10,6 +10,8 @@ const ticketSchema = new mongoose.Schema({
     default: "Open"
   },
   priority: { type: Number, min: 1, max: 10, default: 1 }, // AI-generated priority score
+  summary: String, // AI-generated summary from triage
+  suggestedCategory: String, // Category name suggested by triage
   createdBy: { type: mongoose.Schema.Types.ObjectId, ref: "User", required: true },
   assignedTo: { type: mongoose.Schema.Types.ObjectId, ref: "User" },
   comments: [